@@ -1,5 +1,7 @@
 #!/usr/bin/python3
 
+import numpy as np
+
 ############################################
 
 NUM_AXIS = 3
@@ -277,6 +279,150 @@ def calc_raw():
     # just the raw data
     return costs_cpu["empty_loop_saved"], costs_tx["raw"]
 
+#####################################################
+
+#
+# The same model as in `calc`, compiled for a fixed list of features `fs`.
+# The feature names are parsed just once; after that the costs of many subsets of `fs`
+# are computed in one go, with the subsets given as a boolean matrix (one row per subset,
+# one column per feature in `fs`).
+# The costs are added in the same order as in `calc`, so the results are the same
+# (as long as `calc` gets the features in the order of `fs`).
+#
+
+# the kinds of features shared by `remove_median`
+MEDIAN_OTHER = 0
+MEDIAN_IQR = 1
+MEDIAN_MAX = 2
+MEDIAN_MIN = 3
+MEDIAN_MEDIAN = 4
+
+def median_kind(f):
+    # the same checks (in the same order) as in `remove_median`
+    if "iqr" in f:
+        return MEDIAN_IQR
+    if "max" in f:
+        return MEDIAN_MAX
+    if "min" in f:
+        return MEDIAN_MIN
+    if "median" in f:
+        return MEDIAN_MIN
+    if "q25" in f or "q75" in f:
+        return MEDIAN_MEDIAN
+    return MEDIAN_OTHER
+
+class CostTable(object):
+    def __init__(self, fs):
+        adjust()
+        self.fs = list(fs)
+
+        # transmission costs, per feature
+        self.tx = np.zeros(len(fs))
+        for i, f in enumerate(fs):
+            ftype = extractType(f)
+            if ftype in costs_tx:
+                self.tx[i] = costs_tx[ftype] * (NUM_AXIS if is_multiaxial(f) else 1)
+            else:
+                print("unknown type:", ftype)
+
+        # the transforms each feature needs
+        self.jerk = np.array(["Jerk" in f for f in fs], dtype=bool)
+        self.magsq = np.array(["MagSq" in f for f in fs], dtype=bool)
+        self.l1norm = np.array(["L1Norm" in f for f in fs], dtype=bool)
+
+        # the features are processed in groups, by their prefix
+        self.prefix_classes = []
+        for group in separate_by_prefix(fs):
+            self.prefix_classes.append(np.array([f in group for f in fs], dtype=bool))
+
+        # shared computations
+        self.correlation = np.array(["correlation" in f for f in fs], dtype=bool)
+        self.std = np.array(["std" in f for f in fs], dtype=bool)
+        self.energy = np.array(["energy" in f for f in fs], dtype=bool)
+        mean = np.array(["mean" in f for f in fs], dtype=bool)
+        self.removed_by_correlation = self.correlation | self.std | mean | self.energy
+        self.removed_by_std = self.std | mean | self.energy
+        self.removed_by_energy = mean | self.energy
+        kinds = np.array([median_kind(f) for f in fs], dtype=int)
+        self.iqr = kinds == MEDIAN_IQR
+        self.max = kinds == MEDIAN_MAX
+        self.min = kinds == MEDIAN_MIN
+        self.median = kinds == MEDIAN_MEDIAN
+        self.other = kinds == MEDIAN_OTHER
+
+        # the CPU costs of the features that are not shared with any other feature
+        self.cpu = np.full(len(fs), np.nan)
+        for i, f in enumerate(fs):
+            ftype = extractType(f)
+            if ftype in costs_cpu:
+                self.cpu[i] = costs_cpu[ftype] * (NUM_AXIS if is_multiaxial(f) else 1)
+        # `calc` adds these in alphabetic order (as sorted by `remove_median`)
+        self.cpu_order = np.array(sorted(range(len(fs)), key = lambda i: self.fs[i]), dtype=int)
+
+    def calc_batch(self, masks):
+        masks = np.asarray(masks, dtype=bool).reshape(-1, len(self.fs))
+
+        # Transmission
+        total_tx_cost = np.zeros(len(masks))
+        for i in np.flatnonzero(masks.any(axis=0)):
+            total_tx_cost += np.where(masks[:,i], self.tx[i], 0.0)
+
+        # CPU
+        total_cpu_cost = np.full(len(masks), costs_cpu["empty_loop_saved"])
+
+        # account for all of the transforms needed for the data
+        has_jerk = (masks & self.jerk).any(axis=1)
+        has_magsq = (masks & self.magsq).any(axis=1)
+        has_l1norm = (masks & self.l1norm).any(axis=1)
+        r = np.full(len(masks), costs_cpu["t_median"])
+        r += np.where(has_jerk,
+                      np.where(has_magsq, costs_cpu["t_jerk+magnitude_sq"],
+                               np.where(has_l1norm, costs_cpu["t_jerk+l1norm"], costs_cpu["t_jerk"])),
+                      np.where(has_magsq, costs_cpu["t_magnitude_sq"],
+                               np.where(has_l1norm, costs_cpu["t_l1norm"], 0.0)))
+        total_cpu_cost += r
+
+        for prefix_class in self.prefix_classes:
+            m = masks & prefix_class
+            if not m.any():
+                continue
+
+            has_correlation = (m & self.correlation).any(axis=1)
+            m &= ~(has_correlation[:,None] & self.removed_by_correlation)
+            total_cpu_cost += np.where(has_correlation, costs_cpu["correlation"], 0.0)
+
+            has_std = (m & self.std).any(axis=1)
+            m &= ~(has_std[:,None] & self.removed_by_std)
+            total_cpu_cost += np.where(has_std, costs_cpu["std"], 0.0)
+
+            has_energy = (m & self.energy).any(axis=1)
+            m &= ~(has_energy[:,None] & self.removed_by_energy)
+            total_cpu_cost += np.where(has_energy, costs_cpu["energy"], 0.0)
+
+            has_iqr = (m & self.iqr).any(axis=1)
+            has_max = (m & self.max).any(axis=1)
+            has_min = (m & self.min).any(axis=1)
+            has_median = (m & self.median).any(axis=1)
+            r = np.where(has_min & has_max, costs_cpu["min+max"],
+                         np.where(has_min | has_max, costs_cpu["min"], 0.0))
+            r += np.where(has_median, costs_cpu["median"], 0.0)
+            r += np.where(has_iqr, costs_cpu["iqr"], 0.0)
+            r = np.where(has_median & has_iqr,
+                         np.where(has_min | has_max, costs_cpu["median+iqr+min+max"], costs_cpu["median+iqr"]),
+                         r)
+            total_cpu_cost += r
+
+            # deal with the remaining features not in any of the previous classes
+            m &= self.other
+            present = m.any(axis=0)
+            for i in self.cpu_order[present[self.cpu_order]]:
+                total_cpu_cost += np.where(m[:,i], self.cpu[i], 0.0)
+
+        return total_cpu_cost, total_tx_cost
+
+def compile_costs(fs):
+    return CostTable(fs)
+
 
 #####################################################
 
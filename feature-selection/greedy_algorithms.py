@@ -9,6 +9,9 @@
 import os
 import numpy as np
 import copy
+import heapq
+import json
+import math
 
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import ShuffleSplit
@@ -24,77 +27,565 @@ from ml_config import *
 import ml_state
 
 ###########################################
- 
+
+# the number of candidates evaluated between saving the progress
+# (at least as many as there are worker processes)
+CHECKPOINT_BATCH_SIZE = 10
+
+# the number of stale candidates the lazy greedy re-evaluates at once, in parallel.
+# Not tied to the number of workers, so that the selection does not depend on the machine
+LAZY_BATCH_SIZE = 4
+
+# the number of partial subsets kept at each level of the beam search
+BEAM_WIDTH = 5
+
+# the largest subsets considered by the branch-and-bound search (the `exact` mode)
+EXACT_MAX_SIZE = 3
+# the upper bound of the validation accuracy. With 1.0 no branch is pruned on accuracy, but the scores of
+# the branches are hard to bound, so mostly the energy prunes them. A lower value
+# (e.g. the accuracy with all features) prunes much more, but assumes no subset does better.
+MAX_ACCURACY = 1.0
+
+# with the progressive sampling: the best candidate was not competitive on the small samples,
+# so its full-data accuracy is unknown
+REJECTED_REASON = "stopping: no competitive subsets left (all rejected by the progressive sampling)"
+
+###########################################
+
 class GreedyState(ml_state.State):
-    def greedy(self):
-        # start iterating
-        self.greedy_iteration([], float("-inf"))
+    def __init__(self):
+        super().__init__()
+        # whether to use the lazy greedy: only re-evaluate the candidates with the highest known gain
+        self.use_lazy = False
+        # where to save the progress of the search (None: do not save)
+        self.checkpoint_filename = None
 
-    def greedy_iteration(self, used_features, prev_best):
-        best_score = float("-inf")
-        best_f = -1
-        best_av = None
-        best_at = None
-        best_e = None
+    def greedy(self, resume=False):
+        self.num_evaluations = 0
+        # the selected features, in the order of selection
+        self.selected = []
+        # for each level: the results of the candidates evaluated at that level, by feature
+        self.levels = []
+        # why the search was stopped (None: not stopped yet)
+        self.stop_reason = None
 
-        for f in range(self.num_features):
-            if f in used_features:
-                continue
+        if resume:
+            self.load_checkpoint()
+        elif self.checkpoint_filename is not None and os.access(self.checkpoint_filename, os.F_OK):
+            print("overwriting the checkpoint {} (pass --resume to continue from it)".format(self.checkpoint_filename))
 
-            #print(self.groups[f])
+        # the score of the empty set is the baseline for the gains at the first level
+        score, av, _, _ = self.combined_score([])
+        self.empty_score = av if self.use_accuracy_only else score
+        if self.use_lazy:
+            self.init_lazy_queue()
 
-            updated_features = copy.copy(used_features)
-            updated_features.append(f)
+        # start iterating
+        while self.stop_reason is None:
+            self.greedy_iteration()
+        print("number of evaluations:", self.num_evaluations)
 
+    # evaluate the subsets with each of the `features` added, in parallel
+    def evaluate_batch(self, features):
+        level = len(self.selected)
+        subsets = [self.selected + [f] for f in features]
+        self.num_evaluations += len(subsets)
+        results = []
+        for f, (score, av, at, e) in zip(features, self.combined_score_batch(subsets)):
             if self.use_accuracy_only:
-                av, at = self.eval_accuracy(updated_features)
                 score = av
-                e = None
-            else:
-                score, av, at, e = self.combined_score(updated_features)
+            results.append((f, score, av, at, e))
+            self.levels[level][f] = results[-1]
+        self.save_checkpoint()
+        return results
+
+    def greedy_level(self):
+        level = len(self.selected)
+        # the candidates not evaluated yet (all of them, unless resuming)
+        candidates = [f for f in range(self.num_features)
+                      if f not in self.selected and f not in self.levels[level]]
+        batch_size = max(CHECKPOINT_BATCH_SIZE, ml_state.get_num_workers())
+        for i in range(0, len(candidates), batch_size):
+            self.evaluate_batch(candidates[i:i + batch_size])
 
+        best_score = float("-inf")
+        best = None
+        for f in sorted(self.levels[level]):
+            result = self.levels[level][f]
+            score = result[1]
             if score > best_score:
                 best_score = score
-                best_f = f
-                best_av = av
-                best_at = at
-                best_e = e
+                best = result
+        return best
+
+    # the score the gains at `level` are relative to
+    def base_score(self, level):
+        if level == 0:
+            return self.empty_score
+        return self.levels[level - 1][self.selected[level - 1]][1]
 
-        if best_f == -1:
+    def init_lazy_queue(self):
+        # the last known score gain of each candidate, as a heap of (-gain, feature, level, result);
+        # the gains of the candidates not evaluated yet are unknown (i.e. infinite)
+        self.lazy_queue = []
+        for f in range(self.num_features):
+            if f in self.selected:
+                continue
+            entry = (float("-inf"), f, -1, None)
+            for level in range(len(self.levels)):
+                if f in self.levels[level]:
+                    result = self.levels[level][f]
+                    entry = (self.base_score(level) - result[1], f, level, result)
+            self.lazy_queue.append(entry)
+        heapq.heapify(self.lazy_queue)
+
+    def lazy_greedy_level(self):
+        # The gain of adding a candidate rarely increases as more features are selected,
+        # so the last known gain is an (approximate) upper bound of the current one.
+        # Re-evaluate the candidates in the order of their last known gains,
+        # until the one at the top of the queue has an up-to-date gain.
+        level = len(self.selected)
+        prev_best = self.base_score(level)
+        batch_size = max(CHECKPOINT_BATCH_SIZE, ml_state.get_num_workers())
+        while len(self.lazy_queue):
+            if self.lazy_queue[0][2] == level:
+                # confirmed to be the best one
+                return heapq.heappop(self.lazy_queue)[3]
+            # The gains of the candidates never evaluated are unknown, so evaluate all of them at once,
+            # together with up to LAZY_BATCH_SIZE stale ones with the highest last known gains
+            features = []
+            while len(self.lazy_queue) and self.lazy_queue[0][2] < 0:
+                features.append(heapq.heappop(self.lazy_queue)[1])
+            for i in range(LAZY_BATCH_SIZE):
+                if len(self.lazy_queue) == 0 or self.lazy_queue[0][2] == level:
+                    break
+                features.append(heapq.heappop(self.lazy_queue)[1])
+            for i in range(0, len(features), batch_size):
+                for result in self.evaluate_batch(features[i:i + batch_size]):
+                    heapq.heappush(self.lazy_queue, (prev_best - result[1], result[0], level, result))
+        return None
+
+    def greedy_iteration(self):
+        if len(self.levels) == len(self.selected):
+            self.levels.append({})
+
+        if self.use_lazy:
+            best = self.lazy_greedy_level()
+        else:
+            best = self.greedy_level()
+
+        if best is None:
             # not found any features to use
+            self.stop("stopping: no more features to add")
+            return
+
+        best_f, best_score, best_av, best_at, best_e = best
+
+        if ml_state.is_rejected(best_av):
+            self.stop(REJECTED_REASON)
             return
 
         if best_e >= self.energy_for_raw:
             # energy gets too large
-            print("stopping: spent more energy than for raw data Tx {:.4f} vs {:.4f}".format(
-                  best_e, self.energy_for_raw))
+            self.stop("stopping: spent more energy than for raw data Tx {:.4f} vs {:.4f}".format(
+                      best_e, self.energy_for_raw))
             return
 
-        print("best at", self.groups[best_f], best_score, best_av, best_at, best_e)
-        updated_features = copy.copy(used_features)
-        updated_features.append(best_f)
-        print("one level deeper, used=", [self.groups[x] for x in updated_features])
-        self.greedy_iteration(updated_features, best_score)
+        self.selected.append(best_f)
+        self.save_checkpoint()
+        self.print_level(len(self.selected) - 1)
+
+    def print_level(self, level):
+        best_f, best_score, best_av, best_at, best_e = self.levels[level][self.selected[level]]
+        print("best at {} {} {} {} {}{}".format(self.groups[best_f], best_score, best_av, best_at, best_e,
+                                                 self.describe_variances(self.selected[:level + 1])))
+        print("one level deeper, used=", [self.groups[x] for x in self.selected[:level + 1]])
+
+    def stop(self, reason):
+        self.stop_reason = reason
+        self.save_checkpoint()
+        print(reason)
+
+    def save_checkpoint(self):
+        if self.checkpoint_filename is None:
+            return
+        state = {
+            "use_lazy" : self.use_lazy,
+            "use_accuracy_only" : self.use_accuracy_only,
+            "settings" : self.settings(),
+            "groups" : self.groups,
+            "selected" : self.selected,
+            "levels" : [[[int(f), float(score), float(av), float(at), float(e)]
+                         for f, score, av, at, e in level.values()] for level in self.levels],
+            "stop_reason" : self.stop_reason,
+            "variances" : self.saved_variances(),
+        }
+        # write to a temporary file first, so that a crash does not corrupt the checkpoint
+        tmp_filename = self.checkpoint_filename + ".tmp"
+        with open(tmp_filename, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_filename, self.checkpoint_filename)
+
+    def load_checkpoint(self):
+        if self.checkpoint_filename is None or not os.access(self.checkpoint_filename, os.R_OK):
+            print("no checkpoint found, starting from scratch")
+            return
+        with open(self.checkpoint_filename, "r") as f:
+            state = json.load(f)
+        if state["groups"] != self.groups or state["use_lazy"] != self.use_lazy \
+           or state["use_accuracy_only"] != self.use_accuracy_only:
+            print("the checkpoint {} is for a different search, starting from scratch".format(self.checkpoint_filename))
+            return
+        changed = self.changed_settings(state.get("settings", {}))
+        if len(changed):
+            print("the checkpoint {} was made with different settings ({}), starting from scratch".format(
+                  self.checkpoint_filename, ", ".join(changed)))
+            return
+        self.selected = state["selected"]
+        self.levels = [{r[0] : tuple(r) for r in level} for level in state["levels"]]
+        self.stop_reason = state["stop_reason"]
+        self.restore_variances(state.get("variances", []))
+        print("resuming from {}: {} features selected, {} evaluations done".format(
+              self.checkpoint_filename, len(self.selected), sum(len(level) for level in self.levels)))
+        for level in range(len(self.selected)):
+            self.print_level(level)
+        if self.stop_reason is not None:
+            print(self.stop_reason)
+
+    #
+    # Beam search: like the greedy, but keeps the best BEAM_WIDTH subsets at each level.
+    # All extensions of all of them are evaluated as a single batch, so the subsets reachable
+    # from more than one beam are evaluated just once.
+    #
+    def beam(self):
+        self.num_evaluations = 0
+        # the subsets kept at the current level, as (score, av, at, e, subset) tuples
+        beams = [(None, None, None, None, ())]
+        best = None
+        for level in range(self.num_features):
+            candidates = set()
+            for _, _, _, _, subset in beams:
+                for f in range(self.num_features):
+                    if f not in subset:
+                        candidates.add(tuple(sorted(subset + (f,))))
+            candidates = sorted(candidates)
+
+            # the energy is cheap to compute, so do not spend time on the subsets that use too much of it
+            energies = self.eval_energy_batch(candidates)
+            candidates = [c for c, e in zip(candidates, energies) if e < self.energy_for_raw]
+            if len(candidates) == 0:
+                print("stopping: all subsets spend more energy than for raw data Tx {:.4f}".format(self.energy_for_raw))
+                break
+
+            self.num_evaluations += len(candidates)
+            results = []
+            for subset, (score, av, at, e) in zip(candidates, self.combined_score_batch(candidates)):
+                if self.use_accuracy_only:
+                    score = av
+                results.append((score, av, at, e, subset))
+            # stable sort: on ties, keep the subset that comes first
+            results.sort(key = lambda r: r[0], reverse=True)
+            beams = results[:BEAM_WIDTH]
+
+            score, av, at, e, subset = beams[0]
+            if ml_state.is_rejected(av):
+                print(REJECTED_REASON)
+                break
+            print("level", level + 1, "best", score, av, at, e, [self.groups[x] for x in subset])
+            if best is None or score > best[0]:
+                best = beams[0]
+
+        if best is not None:
+            score, av, at, e, subset = best
+            print("best subset", score, av, at, e, [self.groups[x] for x in subset])
+        print("number of evaluations:", self.num_evaluations)
+
+    #
+    # Sequential floating forward selection: after adding a feature, keep removing features
+    # as long as that gives a better subset than the best one of that size found so far.
+    # The subsets are kept sorted, so the ones seen before are taken from the evaluation cache.
+    #
+    def evaluate_subsets(self, subsets):
+        self.num_evaluations += sum(1 for subset in set(subsets) if subset not in self.accuracy_cache)
+        results = []
+        for subset, (score, av, at, e) in zip(subsets, self.combined_score_batch(subsets)):
+            if self.use_accuracy_only:
+                score = av
+            results.append((score, av, at, e, subset))
+        return results
+
+    def floating(self):
+        self.num_evaluations = 0
+        selected = ()
+        # the best subset found for each size, as (score, av, at, e, subset) tuples
+        best_by_size = {}
+        while len(selected) < self.num_features:
+            # add the best feature
+            candidates = [tuple(sorted(selected + (f,))) for f in range(self.num_features) if f not in selected]
+            # the energy is cheap to compute, so do not spend time on the subsets that use too much of it
+            energies = self.eval_energy_batch(candidates)
+            candidates = [c for c, e in zip(candidates, energies) if e < self.energy_for_raw]
+            if len(candidates) == 0:
+                print("stopping: all subsets spend more energy than for raw data Tx {:.4f}".format(self.energy_for_raw))
+                break
+            # `max` keeps the first one on ties
+            best = max(self.evaluate_subsets(candidates), key = lambda r: r[0])
+            if ml_state.is_rejected(best[1]):
+                print(REJECTED_REASON)
+                break
+            added = (set(best[4]) - set(selected)).pop()
+            selected = best[4]
+            if len(selected) not in best_by_size or best[0] > best_by_size[len(selected)][0]:
+                best_by_size[len(selected)] = best
+            print("added", self.groups[added], best[0], best[1], best[2], best[3])
+
+            # remove features while that improves on the best subset of the smaller size
+            while len(selected) > 2:
+                # do not remove the feature that was just added
+                candidates = [tuple(f for f in selected if f != removed) for removed in selected if removed != added]
+                best = max(self.evaluate_subsets(candidates), key = lambda r: r[0])
+                if best[0] <= best_by_size[len(selected) - 1][0]:
+                    break
+                removed = (set(selected) - set(best[4])).pop()
+                selected = best[4]
+                best_by_size[len(selected)] = best
+                added = None
+                print("removed", self.groups[removed], best[0], best[1], best[2], best[3])
+            print("current=", [self.groups[x] for x in selected])
+
+        for size in sorted(best_by_size):
+            score, av, at, e, subset = best_by_size[size]
+            print("best of size", size, score, av, at, e, [self.groups[x] for x in subset])
+        print("number of evaluations:", self.num_evaluations)
+
+    #
+    # Branch-and-bound search of the best subset with up to `max_size` features.
+    # It assumes that the energy never decreases when features are added, so that the energy of a subset
+    # is a lower bound for the energy of all of its supersets. This holds on the subsets checked so far,
+    # but is not proven for the energy model, so the result is the best subset only as far as it holds.
+    # The branch of a subset is pruned if this bound exceeds the energy for raw data,
+    # or if no supersets can beat the best score found so far, even with the best possible accuracy.
+    #
+    def exact(self, max_size):
+        self.num_evaluations = 0
+        self.num_pruned = 0
+        self.best = None
+        self.branch_and_bound((), max_size)
+
+        total = sum(math.comb(self.num_features, k) for k in range(1, max_size + 1))
+        print("evaluated {} of {} subsets, pruned {} branches".format(self.num_evaluations, total, self.num_pruned))
+        if self.best is not None:
+            score, av, at, e, subset = self.best
+            print("best subset", score, av, at, e, [self.groups[x] for x in subset])
+
+    def score_upper_bound(self, e):
+        if self.use_accuracy_only:
+            return MAX_ACCURACY
+        # the supersets use at least energy `e`, and more energy never gives a higher score
+        return ml_state.weighted_score(MAX_ACCURACY, e)
+
+    def branch_and_bound(self, subset, max_size):
+        first = subset[-1] + 1 if len(subset) else 0
+        children = [subset + (f,) for f in range(first, self.num_features)]
+        if len(children) == 0:
+            return
+
+        energies = self.eval_energy_batch(children)
+        candidates = []
+        for child, e in zip(children, energies):
+            if e >= self.energy_for_raw:
+                self.num_pruned += 1
+            elif self.best is not None and self.score_upper_bound(e) <= self.best[0]:
+                self.num_pruned += 1
+            else:
+                candidates.append(child)
+        if len(candidates) == 0:
+            return
+
+        results = self.evaluate_subsets(candidates)
+        for result in results:
+            if self.best is None or result[0] > self.best[0]:
+                self.best = result
+                score, av, at, e, best_subset = result
+                print("new best", score, av, at, e, [self.groups[x] for x in best_subset])
+
+        if len(subset) + 1 < max_size:
+            # explore the most promising branches first, to improve the bound early
+            results.sort(key = lambda r: r[0], reverse=True)
+            for score, av, at, e, child in results:
+                if self.score_upper_bound(e) > self.best[0]:
+                    self.branch_and_bound(child, max_size)
+                else:
+                    self.num_pruned += 1
+
+    #
+    # Budget-constrained selection: greedily select the most accurate subset whose energy fits in `budget`
+    # (uC per window). The energy is cheap to compute, so no classifiers are trained for the subsets
+    # over the budget. Returns the best subset, as a (av, at, e, subset) tuple, and the number of skipped evaluations.
+    #
+    def budgeted(self, budget):
+        self.num_evaluations = 0
+        num_skipped = 0
+        selected = []
+        best = None
+        reason = "stopping: no more subsets within the budget of {:.4f}".format(budget)
+        while len(selected) < self.num_features:
+            candidates = [selected + [f] for f in range(self.num_features) if f not in selected]
+            energies = self.eval_energy_batch(candidates)
+            feasible = [(c, e) for c, e in zip(candidates, energies) if e <= budget]
+            num_skipped += len(candidates) - len(feasible)
+            if len(feasible) == 0:
+                break
+
+            self.num_evaluations += len(feasible)
+            accuracies = self.eval_accuracy_batch([c for c, e in feasible])
+            level_best = None
+            for (subset, e), (av, at) in zip(feasible, accuracies):
+                if level_best is None or av > level_best[0]:
+                    level_best = (av, at, e, subset)
+
+            if ml_state.is_rejected(level_best[0]):
+                reason = REJECTED_REASON
+                break
+            av, at, e, selected = level_best
+            print("best at {} {} {} {} {}{}".format(self.groups[selected[-1]], av, av, at, e,
+                                                    self.describe_variances(selected)))
+            print("one level deeper, used=", [self.groups[x] for x in selected])
+            if best is None or av > best[0]:
+                best = level_best
+
+        print(reason)
+        if best is not None:
+            av, at, e, subset = best
+            print("most accurate subset within the budget", av, at, e, [self.groups[x] for x in subset])
+        print("number of evaluations: {}, skipped: {}".format(self.num_evaluations, num_skipped))
+        return best, num_skipped
+
+    #
+    # Weight sweep: run the greedy search for each of the (w_accuracy, w_energy) pairs at the same time.
+    # The accuracy does not depend on the weights, so the candidates of all searches are evaluated
+    # as a single batch, and each subset is evaluated just once.
+    #
+    def sweep(self, weights):
+        self.num_evaluations = 0
+        # for each pair of weights: the selected features (as (feature, score, av, at, e) tuples)
+        # and the reason for stopping
+        paths = {w : [] for w in weights}
+        stop_reasons = {}
+        level = 0
+        while len(stop_reasons) < len(weights):
+            level += 1
+            active = [w for w in weights if w not in stop_reasons]
+            candidates = {}
+            for w in active:
+                used = [r[0] for r in paths[w]]
+                candidates[w] = [(f, tuple(sorted(used + [f]))) for f in range(self.num_features) if f not in used]
+            subsets = list(set(subset for w in active for _, subset in candidates[w]))
+            self.num_evaluations += sum(1 for subset in subsets if subset not in self.accuracy_cache)
+            accuracies = dict(zip(subsets, self.eval_accuracy_batch(subsets)))
+            energies = dict(zip(subsets, self.eval_energy_batch(subsets)))
+
+            for w in active:
+                best = None
+                for f, subset in candidates[w]:
+                    av, at = accuracies[subset]
+                    e = energies[subset]
+                    score = av if self.use_accuracy_only else ml_state.weighted_score(av, e, w[0], w[1])
+                    if best is None or score > best[1]:
+                        best = (f, score, av, at, e)
+                if best is None:
+                    stop_reasons[w] = "stopping: no more features to add"
+                elif ml_state.is_rejected(best[2]):
+                    stop_reasons[w] = REJECTED_REASON
+                elif best[4] >= self.energy_for_raw:
+                    stop_reasons[w] = "stopping: spent more energy than for raw data Tx {:.4f} vs {:.4f}".format(
+                                      best[4], self.energy_for_raw)
+                else:
+                    paths[w].append(best)
+            print("level", level, "done, evaluations so far:", self.num_evaluations)
+
+        for w in weights:
+            print("Selection path for W_ACCURACY={} W_ENERGY={}:".format(w[0], w[1]))
+            for i, (f, score, av, at, e) in enumerate(paths[w]):
+                used = [r[0] for r in paths[w][:i + 1]]
+                print("best at {} {} {} {} {}{}".format(self.groups[f], score, av, at, e, self.describe_variances(used)))
+            print(stop_reasons[w])
+        print("number of evaluations:", self.num_evaluations)
 
 ###########################################
 
 def main():
+    args, options = utils.parse_args(sys.argv)
+    # pass `--resume` to continue from the last checkpoint
+    resume = "resume" in options
+    # pass `--budget=<uC>` to select the most accurate subset within an energy budget
+    budget = utils.option_value(options, "budget", float, ENERGY_BUDGET)
+
     dataset = DEFAULT_DATASET
-    if len(sys.argv) > 1:
-        dataset = sys.argv[1]
+    if len(args) > 1:
+        dataset = args[1]
+    mode = args[2] if len(args) > 2 else "greedy"
+    if mode not in ("greedy", "lazy", "beam", "floating", "sweep", "exact"):
+        print("unknown mode:", mode)
+        return
+
+    # the budgeted search is a plain greedy one
+    if mode != "greedy" and budget is not None:
+        print("the {} mode does not support an energy budget".format(mode))
+        return
+    # only the greedy and lazy searches without a budget save their progress
+    if mode not in ("greedy", "lazy") and resume:
+        print("the {} mode cannot be resumed".format(mode))
+        return
+    if budget is not None and resume:
+        print("the search within an energy budget cannot be resumed")
+        return
 
     s = GreedyState()
+    if mode == "lazy":
+        s.use_lazy = True
+    if mode in ("greedy", "lazy") and budget is None:
+        s.checkpoint_filename = "{}_{}.checkpoint".format(os.path.basename(dataset).replace(" ", "_"), mode)
     print("Loading...")
     s.load(dataset)
 #    print("Evaluating baseline accuracy (all features)...")
 #    s.evaluate_baseline()
-    print("Running greedy, combined score...")
+    if mode == "beam":
+        print("Running beam search with beam width {}, combined score...".format(BEAM_WIDTH))
+        s.use_accuracy_only = False
+        s.beam()
+        return
+    if mode == "floating":
+        print("Running sequential floating forward selection, combined score...")
+        s.use_accuracy_only = False
+        s.floating()
+        return
+    if mode == "sweep":
+        print("Running greedy for {} pairs of weights, combined score...".format(len(SWEEP_WEIGHTS)))
+        s.use_accuracy_only = False
+        s.sweep(SWEEP_WEIGHTS)
+        return
+    if mode == "exact":
+        print("Running branch-and-bound search for subsets of up to {} features, combined score...".format(EXACT_MAX_SIZE))
+        s.use_accuracy_only = False
+        s.exact(EXACT_MAX_SIZE)
+        return
+    if budget is not None:
+        print("Running greedy within the energy budget of {:.4f} uC, accuracy only...".format(budget))
+        s.use_accuracy_only = True
+        s.budgeted(budget)
+        return
+    if s.use_lazy:
+        print("Running lazy greedy, combined score...")
+    else:
+        print("Running greedy, combined score...")
     s.use_accuracy_only = False
-    s.greedy()
+    s.greedy(resume)
     if 0:
         print("Running greedy, accuracy only...")
         s.use_accuracy_only = True
-        s.greedy()
+        s.checkpoint_filename = s.checkpoint_filename.replace(".checkpoint", "_accuracy.checkpoint")
+        s.greedy(resume)
 
 ###########################################
 
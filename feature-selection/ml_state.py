@@ -1,8 +1,8 @@
 import os
 import numpy as np
 import copy
+import multiprocessing
 
-from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import ShuffleSplit, KFold
 from sklearn.metrics import f1_score
 
@@ -13,6 +13,60 @@ sys.path.append("../energy-model")
 import utils
 import energy_model
 from ml_config import *
+import classifiers
+
+###########################################
+
+#
+# Parallel evaluation. The worker processes are forked from the main process,
+# so they share the (read-only) data of the state instead of copying it.
+# They are started at the first parallel call and reused for the rest of the search,
+# so the data they use must be set up by then.
+#
+
+# the state the worker processes operate on
+_worker_state = None
+# whether this is a worker process
+_is_worker = False
+
+def _init_worker(state):
+    global _is_worker, _worker_state
+    _is_worker = True
+    _worker_state = state
+
+def _run_in_worker(args):
+    method, method_args, progressive_best = args
+    # use the thresholds of the progressive sampling of the main process, whichever tasks this worker did before,
+    # so that the results do not depend on how the tasks are spread over the workers
+    _worker_state.progressive_best = progressive_best
+    return getattr(_worker_state, method)(*method_args)
+
+def get_num_workers():
+    if NUM_WORKERS is None:
+        return multiprocessing.cpu_count()
+    return NUM_WORKERS
+
+# the blocks of training data are stored column-major, so selecting a subset of the columns is a cheap gather.
+# (They are also converted to the input type of the classifier in advance, not on every fit.)
+def as_block(data, dtype):
+    return np.asfortranarray(data, dtype=dtype)
+
+# the accuracy of the subsets rejected by the progressive sampling: like the positions over
+# the energy budget in the PSO, they are not evaluated on all of the data, so they are not competitive
+REJECTED_ACCURACY = 0.0
+
+def is_rejected(av):
+    return USE_PROGRESSIVE_SAMPLING and av == REJECTED_ACCURACY
+
+# The order of the columns changes the results of the classifier, so the subsets are always evaluated
+# (and cached) with their indexes in the same order, whichever order the search has selected them in
+def canonical_subset(indexes):
+    return tuple(sorted(indexes))
+
+def weighted_score(av, b, w_accuracy = W_ACCURACY, w_energy = W_ENERGY):
+    return roundacc(w_accuracy * av) + w_energy * b
+
+###########################################
 
 class State:
     def __init__(self):
@@ -20,6 +74,42 @@ class State:
         self.use_accuracy_only = False
         # whether to operate at group or individual vector level
         self.do_subselection = False
+        # the training sample of each stage of the progressive sampling (None: all of the data)
+        self.sample_rows = [None]
+        self.reset_progressive_sampling()
+        # the classifier used for evaluation
+        self.backend = classifiers.get_backend(CLASSIFIER)
+        # the accuracy of the subsets evaluated in batches, by their canonical tuple of indexes (None: do not cache)
+        self.accuracy_cache = {}
+        # in the leave-one-subject-out mode: the variances of the validation and test scores across the subjects,
+        # by the canonical tuple of the indexes of the subset
+        self.accuracy_variances = {}
+        # the pool of worker processes, started on demand
+        self.pool = None
+
+    # the settings the evaluation results depend on, for checking that saved results can be reused
+    def settings(self):
+        return {
+            "dataset" : self.dataset,
+            "do_subselection" : self.do_subselection,
+            "classifier" : CLASSIFIER,
+            "num_trees" : NUM_TREES,
+            "quantization_bins" : QUANTIZATION_BINS if self.backend.use_quantized else None,
+            "w_accuracy" : W_ACCURACY,
+            "w_energy" : W_ENERGY,
+            "random_accuracy" : RANDOM_ACCURACY,
+            "use_n_fold_cross_validation" : USE_N_FOLD_CROSS_VALIDATION,
+            "num_validation_iterations" : NUM_VALIDATION_ITERATIONS,
+            "use_leave_one_subject_out" : USE_LEAVE_ONE_SUBJECT_OUT,
+            "num_trials" : NUM_TRIALS,
+            "progressive_sample_sizes" : list(PROGRESSIVE_SAMPLE_SIZES) if USE_PROGRESSIVE_SAMPLING else None,
+            "progressive_margin" : PROGRESSIVE_MARGIN if USE_PROGRESSIVE_SAMPLING else None,
+        }
+
+    # the names of the settings that differ from the saved ones
+    def changed_settings(self, saved):
+        current = self.settings()
+        return sorted(name for name in set(current) | set(saved) if current.get(name) != saved.get(name))
 
     def load_subset(self, dataset, name):
         filename = os.path.join("..", "datasets", dataset, name, "features.csv")
@@ -31,6 +121,7 @@ class State:
         return data, activities, subjects
 
     def load(self, dataset):
+        self.dataset = dataset
         self.train, self.train_y, self.train_subjects = self.load_subset(dataset, "train")
         self.validation, self.validation_y, self.validation_subjects = self.load_subset(dataset, "validation")
         self.test, self.test_y, self.test_subjects = self.load_subset(dataset, "test")
@@ -39,6 +130,11 @@ class State:
             self.alltrain = np.concatenate((self.train, self.validation, self.test))
             self.alltrain_y = np.concatenate((self.train_y, self.validation_y, self.test_y))
             self.alltrain_subjects = np.concatenate((self.train_subjects, self.validation_subjects, self.test_subjects))
+
+        if USE_N_FOLD_CROSS_VALIDATION and USE_LEAVE_ONE_SUBJECT_OUT:
+            # the folds of each subject are made from `alltrain` in `init_leave_one_subject_out`
+            print("number of subjects left out in turn:", len(np.unique(self.alltrain_subjects)))
+        elif USE_N_FOLD_CROSS_VALIDATION:
             # just pick the first one
             self.subject_left_out = self.alltrain_subjects[0]
 
@@ -65,6 +161,8 @@ class State:
             self.left_out = np.asarray(self.left_out)
             self.left_out_y = np.asarray(self.left_out_y).ravel()
 
+        if self.backend.use_quantized:
+            self.quantize_features()
 
         filename = os.path.join("..", "feature_names.csv")
         self.names = utils.read_list_of_features(filename)
@@ -80,16 +178,125 @@ class State:
 
         self.num_features = len(self.groups) # number of features
 
+        # parse the feature names for the energy model just once
+        self.energy_table = energy_model.compile_costs(self.groups)
+
         # get the energy for raw data, used to stop iterating
         self.energy_for_raw = self.eval_energy_for_raw()
         print("Stopping energy value is {:.4f}".format(self.energy_for_raw))
 
+        if USE_PROGRESSIVE_SAMPLING and not (USE_N_FOLD_CROSS_VALIDATION and USE_LEAVE_ONE_SUBJECT_OUT):
+            self.init_progressive_sampling()
+        else:
+            self.sample_rows = [None]
+        self.reset_progressive_sampling()
+
+        if USE_N_FOLD_CROSS_VALIDATION and USE_LEAVE_ONE_SUBJECT_OUT:
+            self.init_leave_one_subject_out()
+        else:
+            self.init_folds()
+
+    def quantize_features(self):
+        # the bin edges are computed on the data the classifier is trained on
+        if USE_N_FOLD_CROSS_VALIDATION and USE_LEAVE_ONE_SUBJECT_OUT:
+            # each of the subjects is in the training data of the others
+            bin_edges = classifiers.compute_bin_edges(self.alltrain)
+        elif USE_N_FOLD_CROSS_VALIDATION:
+            bin_edges = classifiers.compute_bin_edges(self.cv)
+        else:
+            bin_edges = classifiers.compute_bin_edges(self.train)
+        self.train = classifiers.quantize(self.train, bin_edges)
+        self.validation = classifiers.quantize(self.validation, bin_edges)
+        self.test = classifiers.quantize(self.test, bin_edges)
+        if USE_N_FOLD_CROSS_VALIDATION:
+            self.alltrain = classifiers.quantize(self.alltrain, bin_edges)
+        if USE_N_FOLD_CROSS_VALIDATION and not USE_LEAVE_ONE_SUBJECT_OUT:
+            self.cv = classifiers.quantize(self.cv, bin_edges)
+            self.left_out = classifiers.quantize(self.left_out, bin_edges)
+        print("quantized the features in {} bins for the {} classifier".format(QUANTIZATION_BINS, CLASSIFIER))
+
+    # the best validation score seen at each stage of the progressive sampling.
+    # The models trained on the smaller samples score lower, so each stage is compared with its own best
+    def reset_progressive_sampling(self):
+        self.progressive_best = [float("-inf")] * len(self.sample_rows)
+
+    def update_progressive_best(self, stage_scores):
+        for stage, score in enumerate(stage_scores):
+            self.progressive_best[stage] = max(self.progressive_best[stage], score)
+
+    def init_progressive_sampling(self):
+        # the windows the classifier is trained on
+        if USE_N_FOLD_CROSS_VALIDATION:
+            y = self.cv_y
+        else:
+            y = self.train_y
+        # the samples are stratified by activity and nested: each stage extends the previous one
+        rng = np.random.RandomState(0)
+        permutations = [rng.permutation(np.flatnonzero(y == label)) for label in np.unique(y)]
+        self.sample_rows = []
+        for fraction in PROGRESSIVE_SAMPLE_SIZES:
+            if fraction >= 1.0:
+                self.sample_rows.append(None)
+                break
+            rows = [p[:int(np.ceil(fraction * len(p)))] for p in permutations]
+            # keep the original order of the windows
+            self.sample_rows.append(np.sort(np.concatenate(rows)))
+            print("progressive sampling stage: {} windows".format(len(self.sample_rows[-1])))
+        if self.sample_rows[-1] is not None:
+            # always finish with the full data
+            self.sample_rows.append(None)
+
+    def init_folds(self):
+        # The training data is split in folds just once, for each sample size.
+        block = lambda data: as_block(data, self.backend.dtype)
+
+        # for each stage, a list of (train features, train labels, test features, test labels) tuples
+        self.fold_blocks = []
+        for rows in self.sample_rows:
+            blocks = []
+            if USE_N_FOLD_CROSS_VALIDATION:
+                features = self.cv if rows is None else self.cv[rows]
+                y = self.cv_y if rows is None else self.cv_y[rows]
+                rs = KFold(n_splits = NUM_VALIDATION_ITERATIONS)
+                for train_index, test_index in rs.split(features):
+                    blocks.append((block(features[train_index]), y[train_index],
+                                   block(features[test_index]), y[test_index]))
+            else:
+                features = self.train if rows is None else self.train[rows]
+                y = self.train_y if rows is None else self.train_y[rows]
+                blocks.append((block(features), y, block(self.validation), self.validation_y))
+            self.fold_blocks.append(blocks)
+
+        if USE_N_FOLD_CROSS_VALIDATION:
+            self.left_out_block = block(self.left_out)
+        else:
+            self.test_block = block(self.test)
+
+    def init_leave_one_subject_out(self):
+        # The data of the other subjects is split in folds just once for each of the subjects, like in `init_folds`.
+        # For each subject: a list of (train features, train labels, test features, test labels) tuples,
+        # and the features and labels of the subject
+        self.loso_subjects = np.unique(self.alltrain_subjects)
+        self.loso_blocks = []
+        self.alltrain_y = self.alltrain_y.ravel()
+        rs = KFold(n_splits = NUM_VALIDATION_ITERATIONS)
+        for subject in self.loso_subjects:
+            left_out_rows = np.flatnonzero(self.alltrain_subjects == subject)
+            cv_rows = np.flatnonzero(self.alltrain_subjects != subject)
+            folds = []
+            for train_index, test_index in rs.split(cv_rows):
+                train_rows = cv_rows[train_index]
+                test_rows = cv_rows[test_index]
+                folds.append((as_block(self.alltrain[train_rows], self.backend.dtype), self.alltrain_y[train_rows],
+                              as_block(self.alltrain[test_rows], self.backend.dtype), self.alltrain_y[test_rows]))
+            self.loso_blocks.append((folds, as_block(self.alltrain[left_out_rows], self.backend.dtype),
+                                     self.alltrain_y[left_out_rows]))
+
     def evaluate_baseline(self):
         validation_scores = []
         test_scores = []
         for i in range(10):
-            clf = RandomForestClassifier(n_estimators = NUM_TREES, random_state=i,
-                                         class_weight = "balanced")
+            clf = self.backend.make(i)
 
             clf.fit(self.train, self.train_y)
 
@@ -108,30 +315,72 @@ class State:
         print("test      :" , "{:.4f}".format(s_test), test_scores)
 
     def eval_accuracy(self, indexes):
+        indexes = list(canonical_subset(indexes))
+        validation_score, test_score, stage_scores, variances = self.eval_accuracy_stages(indexes)
+        self.update_progressive_best(stage_scores)
+        self.record_variances(indexes, variances)
+        return validation_score, test_score
+
+    # returns the validation and test scores, the validation score at each of the progressive sampling stages done,
+    # and in the leave-one-subject-out mode, the variances of the scores across the subjects (None otherwise).
+    # The thresholds of the stages are not updated here, so that a batch gives the same results in any order
+    def eval_accuracy_stages(self, indexes):
         if len(indexes) == 0:
-            return RANDOM_ACCURACY, RANDOM_ACCURACY
+            return RANDOM_ACCURACY, RANDOM_ACCURACY, [], None
+
+        if USE_N_FOLD_CROSS_VALIDATION and USE_LEAVE_ONE_SUBJECT_OUT:
+            validation_score, validation_variance, test_score, test_variance = self.eval_accuracy_loso(indexes)
+            return validation_score, test_score, [], (validation_variance, test_variance)
 
         selector = utils.select(self.names, self.groups, indexes, self.do_subselection)
 
+        stage_scores = []
+        for stage in range(len(self.sample_rows) - 1):
+            validation_score, test_score = self.eval_accuracy_on_stage(selector, stage)
+            stage_scores.append(validation_score)
+            if validation_score < self.progressive_best[stage] - PROGRESSIVE_MARGIN:
+                # not competitive: do not spend time on the larger samples.
+                # The score on this sample is biased low, so do not report it as the accuracy
+                return REJECTED_ACCURACY, REJECTED_ACCURACY, stage_scores, None
+
+        validation_score, test_score = self.eval_accuracy_on_stage(selector, len(self.sample_rows) - 1)
+        stage_scores.append(validation_score)
+        return validation_score, test_score, stage_scores, None
+
+    def record_variances(self, indexes, variances):
+        if variances is not None:
+            self.accuracy_variances[canonical_subset(indexes)] = variances
+
+    # the recorded variances as a list of [indexes, validation variance, test variance] lists, for the checkpoints
+    def saved_variances(self):
+        return [[list(indexes), float(vv), float(vt)] for indexes, (vv, vt) in self.accuracy_variances.items()]
+
+    def restore_variances(self, saved):
+        for indexes, vv, vt in saved:
+            self.record_variances(indexes, (vv, vt))
+
+    # the variances of the scores of a subset across the subjects, to append to its line in the log ("" if unknown)
+    def describe_variances(self, indexes):
+        variances = self.accuracy_variances.get(canonical_subset(indexes))
+        if variances is None:
+            return ""
+        return " variance={:.6f}/{:.6f}".format(*variances)
+
+    # evaluate on the selected columns, training on the sample of the progressive sampling `stage`
+    def eval_accuracy_on_stage(self, selector, stage):
         if USE_N_FOLD_CROSS_VALIDATION:
-            features = self.cv[:,selector]
-            left_out_features = self.left_out[:,selector]
+            left_out_features = self.left_out_block[:,selector]
             validation_score = 0
             test_score = 0
-#            rs = ShuffleSplit(n_splits = NUM_VALIDATION_ITERATIONS, test_size = 0.33)
-            rs = KFold(n_splits = NUM_VALIDATION_ITERATIONS) #, test_size = 0.33)
             scores = []
-            # use balanced weigths to account for class imbalance
-            # (we're trying to optimize f1 score, not accuracy)
-            clf = RandomForestClassifier(n_estimators = NUM_TREES, random_state=0,
-                                         class_weight = "balanced")
-            for train_index, test_index in rs.split(features):
-                clf.fit(features[train_index], self.cv_y[train_index])
-#                s1 = clf.score(features[test_index], self.cv_y[test_index])
+            clf = self.backend.make(0)
+            for train_features, train_y, test_features, test_y in self.fold_blocks[stage]:
+                clf.fit(train_features[:,selector], train_y)
+#                s1 = clf.score(test_features[:,selector], test_y)
 #                s2 = clf.score(left_out_features, self.left_out_y)
 
-                hypothesis = clf.predict(features[test_index])
-                s1 = f1_score(self.cv_y[test_index], hypothesis, average="micro")
+                hypothesis = clf.predict(test_features[:,selector])
+                s1 = f1_score(test_y, hypothesis, average="micro")
 
                 hypothesis = clf.predict(left_out_features)
                 s2 = f1_score(self.left_out_y, hypothesis, average="micro")
@@ -146,24 +395,22 @@ class State:
 #            print("validation/test:" , scores)
         else:
             # simply train and then evaluate
-            features_train = self.train[:,selector]
-            features_validation = self.validation[:,selector]
+            train_features, train_y, validation_features, validation_y = self.fold_blocks[stage][0]
+            features_train = train_features[:,selector]
+            features_validation = validation_features[:,selector]
             scores = []
             for i in range(NUM_TRIALS):
-                # use balanced weigths to account for class imbalance
-                # (we're trying to optimize f1 score, not accuracy)
-                clf = RandomForestClassifier(n_estimators = NUM_TREES, random_state=i,
-                                             class_weight = "balanced")
-                clf.fit(features_train, self.train_y)
-                #validation_score = clf.score(features_validation, self.validation_y)
+                clf = self.backend.make(i)
+                clf.fit(features_train, train_y)
+                #validation_score = clf.score(features_validation, validation_y)
                 hypothesis = clf.predict(features_validation)
-                #c = (self.validation_y == hypothesis)
-                f1 = f1_score(self.validation_y, hypothesis, average="micro")
+                #c = (validation_y == hypothesis)
+                f1 = f1_score(validation_y, hypothesis, average="micro")
                 scores.append(f1)
             validation_score = np.mean(scores)
 
             # check also the results on the test set
-            features_test = self.test[:,selector]
+            features_test = self.test_block[:,selector]
             hypothesis = clf.predict(features_test)
             f1 = f1_score(self.test_y, hypothesis, average="micro")
             test_score = f1
@@ -171,17 +418,94 @@ class State:
         #print("validation={:.2f} test={:.2f}".format(validation_score, test_score))
         return validation_score, test_score
 
+    # leave out each subject in turn; returns the mean and the variance of the validation and test scores
+    def eval_accuracy_loso(self, indexes):
+        selector = utils.select(self.names, self.groups, indexes, self.do_subselection)
+        args = [(selector, k) for k in range(len(self.loso_blocks))]
+        scores = np.asarray(list(self.imap_parallel("eval_accuracy_subject", args)))
+        return np.mean(scores[:,0]), np.var(scores[:,0]), np.mean(scores[:,1]), np.var(scores[:,1])
+
+    # evaluate with the `k`-th subject left out
+    def eval_accuracy_subject(self, selector, k):
+        folds, left_out_block, left_out_y = self.loso_blocks[k]
+        left_out_features = left_out_block[:,selector]
+        validation_score = 0
+        test_score = 0
+        clf = self.backend.make(0)
+        for train_features, train_y, test_features, test_y in folds:
+            clf.fit(train_features[:,selector], train_y)
+
+            hypothesis = clf.predict(test_features[:,selector])
+            validation_score += f1_score(test_y, hypothesis, average="micro")
+
+            hypothesis = clf.predict(left_out_features)
+            test_score += f1_score(left_out_y, hypothesis, average="micro")
+        validation_score /= NUM_VALIDATION_ITERATIONS
+        test_score /= NUM_VALIDATION_ITERATIONS
+        return validation_score, test_score
+
+    # call `method` with each of the `list_of_args` in the worker processes; yields the results in order
+    def imap_parallel(self, method, list_of_args):
+        if get_num_workers() <= 1 or len(list_of_args) <= 1 or _is_worker:
+            # no nested parallelism
+            for args in list_of_args:
+                yield getattr(self, method)(*args)
+            return
+        if self.pool is None:
+            ctx = multiprocessing.get_context("fork")
+            self.pool = ctx.Pool(get_num_workers(), initializer=_init_worker, initargs=(self,))
+        # the tasks are sent while the results come in, so take a copy of the thresholds
+        progressive_best = list(self.progressive_best)
+        tasks = [(method, args, progressive_best) for args in list_of_args]
+        for r in self.pool.imap(_run_in_worker, tasks):
+            yield r
+
+    # evaluate the accuracy of many subsets in parallel;
+    # duplicate subsets and the subsets already in the cache are evaluated just once
+    def eval_accuracy_batch(self, list_of_indexes):
+        cache = self.accuracy_cache if self.accuracy_cache is not None else {}
+        keys = [canonical_subset(indexes) for indexes in list_of_indexes]
+        unique = list(dict.fromkeys(keys))
+        missing = [indexes for indexes in unique if indexes not in cache]
+        # all subsets of the batch use the same progressive sampling thresholds, updated once all are done
+        evaluated = list(self.imap_parallel("eval_accuracy_stages", [(list(indexes),) for indexes in missing]))
+        results = {}
+        for indexes, (av, at, stage_scores, variances) in zip(missing, evaluated):
+            results[indexes] = (av, at)
+            self.update_progressive_best(stage_scores)
+            self.record_variances(indexes, variances)
+        cache.update(results)
+        return [cache[key] for key in keys]
+
     def eval_energy(self, indexes):
-        names = [self.groups[i] for i in indexes]
+        #names = [self.groups[i] for i in indexes]
         #print("names=", names)
-        return sum(energy_model.calc(names))
+        cpu, tx = self.energy_table.calc_batch(self.subset_masks([indexes]))
+        return cpu[0] + tx[0]
+
+    # the energy of many subsets at once
+    def eval_energy_batch(self, list_of_indexes):
+        cpu, tx = self.energy_table.calc_batch(self.subset_masks(list_of_indexes))
+        return cpu + tx
+
+    # convert lists of indexes to a boolean matrix, one row per subset
+    def subset_masks(self, list_of_indexes):
+        masks = np.zeros((len(list_of_indexes), self.num_features), dtype=bool)
+        for i, indexes in enumerate(list_of_indexes):
+            masks[i, list(indexes)] = True
+        return masks
 
     def combined_score(self, indexes):
         av, at = self.eval_accuracy(indexes)
         b = self.eval_energy(indexes)
-        score = roundacc(W_ACCURACY * av) + W_ENERGY * b
+        score = weighted_score(av, b)
         return score, av, at, b
 
+    def combined_score_batch(self, list_of_indexes):
+        accuracies = self.eval_accuracy_batch(list_of_indexes)
+        energies = self.eval_energy_batch(list_of_indexes)
+        return [(weighted_score(av, b), av, at, b) for (av, at), b in zip(accuracies, energies)]
+
     def eval_energy_for_raw(self):
         return sum(energy_model.calc_raw())
 
@@ -7,9 +7,9 @@
 #
 
 import os
+import json
 import numpy as np
 
-from sklearn.metrics import mutual_info_score
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import ShuffleSplit
 from sklearn.metrics import f1_score
@@ -24,34 +24,170 @@ from ml_config import *
 
 import ml_state
 
+# at most 256, so that the bin codes fit in uint8
 NUM_BINS = 256
 
+# the max number of elements in the contingency table index array built at once
+MAX_CHUNK_SIZE = 1 << 24
+
+# mRMR: the pairwise feature-feature MI is estimated with fewer bins, on an evenly spaced sample of the rows
+MRMR_NUM_BINS = 16
+MRMR_MAX_ROWS = 20000
+
 ###########################################
 
-class MIState(ml_state.State):
-    def calc_MI(self, x, y, bins):
-        c_xy = np.histogram2d(x, y, bins)[0]
-        mi = mutual_info_score(None, None, contingency=c_xy)
-        return mi
+#
+# Put each column in NUM_BINS equal-width bins between its min and max values (as `np.histogram2d` does).
+#
+def bin_columns(data, num_bins = NUM_BINS):
+    num_rows, num_columns = data.shape
+    low = data.min(axis=0).astype(np.float64)
+    width = data.max(axis=0) - low
+    # constant columns: all values in the first bin
+    width[width == 0] = 1.0
+    scale = num_bins / width
+
+    result = np.empty(data.shape, dtype=np.uint8)
+    chunk = max(1, MAX_CHUNK_SIZE // max(1, num_rows))
+    for start in range(0, num_columns, chunk):
+        end = min(start + chunk, num_columns)
+        codes = data[:,start:end].astype(np.float64)
+        codes -= low[start:end]
+        codes *= scale[start:end]
+        # the max value goes in the last bin
+        np.minimum(codes, num_bins - 1, out=codes)
+        # the values are nonnegative, so the conversion rounds them down
+        result[:,start:end] = codes
+    return result
 
-    def class_entropy(self, results, features, y, name, name_index, is_single = False):
-        #print("class", name)
+#
+# Calculate the mutual information between the labels and each of the binned columns.
+# The label-bin contingency tables of many columns are counted by a single `np.bincount` call.
+#
+def mutual_information_columns(codes, y, num_bins = NUM_BINS):
+    num_rows, num_columns = codes.shape
+    _, labels = np.unique(y, return_inverse=True)
+    num_classes = labels.max() + 1 if num_rows else 0
+    table_size = num_classes * num_bins
+
+    chunk = max(1, MAX_CHUNK_SIZE // max(1, num_rows))
+    # the index of each value in the contingency tables of a chunk
+    index_type = np.int32 if chunk * table_size < 2**31 else np.int64
+    row_offsets = (labels.astype(index_type) * num_bins)[:,None]
+
+    result = np.zeros(num_columns)
+    for start in range(0, num_columns, chunk):
+        end = min(start + chunk, num_columns)
+        column_offsets = np.arange(end - start, dtype=index_type) * table_size
+        index = row_offsets + column_offsets
+        index += codes[:,start:end]
+        counts = np.bincount(index.ravel(), minlength=(end - start) * table_size)
+        counts = counts.reshape(end - start, num_classes, num_bins).astype(np.float64)
+
+        # MI = sum p(y,x) * log(p(y,x) / (p(y) * p(x)))
+        label_counts = counts.sum(axis=2, keepdims=True)
+        bin_counts = counts.sum(axis=1, keepdims=True)
+        nonzero = counts > 0
+        expected = label_counts * bin_counts
+        terms = np.zeros(counts.shape)
+        terms[nonzero] = counts[nonzero] * np.log(counts[nonzero] * num_rows / expected[nonzero])
+        result[start:end] = terms.sum(axis=(1, 2)) / num_rows
+    return result
 
-        selector = utils.select(self.names, self.groups, [name_index], self.do_subselection)
-        r = 0
-        for index in selector:
-            feature = features[:,index]
-            t = self.calc_MI(y, feature, NUM_BINS)
-            #print("for feature with index", index, t)
-            r += t
+###########################################
 
-        results.append((r, name, name_index))
+class MIState(ml_state.State):
+    def __init__(self):
+        super().__init__()
+        # the train features binned for the mRMR selection
+        self.mrmr_codes = None
+
+    def column_mi(self):
+        return mutual_information_columns(bin_columns(self.train), self.train_y)
+
+    # the MI between the column `a` and all the columns after it
+    def pairwise_mi_row(self, a):
+        return mutual_information_columns(self.mrmr_codes[:,a+1:], self.mrmr_codes[:,a], MRMR_NUM_BINS)
+
+    # the settings the pairwise MI matrix depends on, besides the data
+    def pairwise_mi_settings(self):
+        return {
+            "num_columns" : self.train.shape[1],
+            "num_bins" : MRMR_NUM_BINS,
+            "max_rows" : MRMR_MAX_ROWS,
+            "do_subselection" : self.do_subselection,
+            # the features are binned after the quantization, if the classifier uses it
+            "classifier" : CLASSIFIER,
+            "quantization_bins" : QUANTIZATION_BINS if self.backend.use_quantized else None,
+        }
+
+    # the matrix is cached in `filename`, along with its settings; it is recomputed if they or the data change
+    def pairwise_mi(self, filename):
+        num_columns = self.train.shape[1]
+        settings = json.dumps(self.pairwise_mi_settings(), sort_keys=True)
+        features_filename = os.path.join("..", "datasets", self.dataset, "train", "features.csv")
+        if os.access(filename, os.R_OK) and os.path.getmtime(filename) >= os.path.getmtime(features_filename):
+            with np.load(filename) as cached:
+                if str(cached["settings"]) == settings:
+                    print("loaded the pairwise MI matrix from", filename)
+                    return cached["matrix"]
+            print("the pairwise MI matrix in {} is for different settings, recomputing".format(filename))
+
+        print("Calculating pairwise mutual information...")
+        matrix = np.zeros((num_columns, num_columns))
+        rows = self.imap_parallel("pairwise_mi_row", [(a,) for a in range(num_columns - 1)])
+        for a, row in enumerate(rows):
+            matrix[a,a+1:] = row
+            matrix[a+1:,a] = row
+        # write to a temporary file first, so that an interrupted run does not leave a broken cache
+        tmp_filename = filename + ".tmp"
+        with open(tmp_filename, "wb") as f:
+            np.savez(f, matrix=matrix, settings=settings)
+        os.replace(tmp_filename, filename)
+        return matrix
+
+    #
+    # Minimum redundancy maximum relevance: each time select the group with the max relevance
+    # (MI with the labels) minus its mean redundancy (MI with the already selected groups).
+    # The groups have different numbers of columns, so both are averaged over the columns.
+    #
+    def mrmr(self):
+        rows = np.linspace(0, len(self.train) - 1, min(len(self.train), MRMR_MAX_ROWS)).astype(int)
+        self.mrmr_codes = bin_columns(self.train[rows], MRMR_NUM_BINS)
+        relevance_columns = mutual_information_columns(self.mrmr_codes, self.train_y[rows], MRMR_NUM_BINS)
+        filename = os.path.join("..", "datasets", self.dataset, "pairwise_mi.npz")
+        matrix = self.pairwise_mi(filename)
+
+        # average the column MI over the groups
+        membership = np.zeros((len(self.groups), self.train.shape[1]))
+        for i in range(len(self.groups)):
+            selector = utils.select(self.names, self.groups, [i], self.do_subselection)
+            membership[i, selector] = 1.0 / len(selector)
+        relevance = membership @ relevance_columns
+        redundancy = membership @ matrix @ membership.T
+
+        results = []
+        total_redundancy = np.zeros(len(self.groups))
+        available = np.ones(len(self.groups), dtype=bool)
+        while available.any():
+            score = relevance - total_redundancy / max(1, len(results))
+            score[~available] = float("-inf")
+            i = int(np.argmax(score))
+            results.append((float(score[i]), self.groups[i], i))
+            available[i] = False
+            total_redundancy += redundancy[i]
 
+        for r in results:
+            print(r)
+
+        return results
 
     def mi(self):
+        column_mi = self.column_mi()
         results = []
         for i, grname in enumerate(self.groups):
-            self.class_entropy(results, self.train, self.train_y, grname, i)
+            selector = utils.select(self.names, self.groups, [i], self.do_subselection)
+            results.append((float(column_mi[selector].sum()), grname, i))
 
         results.sort(reverse=True)
         for r in results:
@@ -66,20 +202,31 @@ def main():
     dataset = DEFAULT_DATASET
     if len(sys.argv) > 1:
         dataset = sys.argv[1]
+    # pass `mrmr` to rank the groups by relevance minus redundancy
+    do_mrmr = len(sys.argv) > 2 and sys.argv[2] == "mrmr"
 
     s = MIState()
     print("Loading...")
     s.load(dataset)
-    print("Calculating mutual information...")
-    r = s.mi()
-    feature_indexes = []
-    for i in range(len(r)):
-        score, name, index = r[i]
-        feature_indexes.append(index)
-        score, av, at, e = s.combined_score(feature_indexes)
-        if e >= s.energy_for_raw:
-            break # too large energy, stop iterating
-        print("best at", name, score, av, at, e)
+    if do_mrmr:
+        print("Calculating minimum redundancy maximum relevance ranking...")
+        r = s.mrmr()
+    else:
+        print("Calculating mutual information...")
+        r = s.mi()
+
+    # the energy is cheap to compute, so find all prefixes of the ranking below the energy for raw data first
+    prefixes = [[index for score, name, index in r[:i + 1]] for i in range(len(r))]
+    energies = s.eval_energy_batch(prefixes)
+    num_prefixes = 0
+    while num_prefixes < len(prefixes) and energies[num_prefixes] < s.energy_for_raw:
+        num_prefixes += 1
+
+    # evaluate them in parallel
+    accuracies = s.eval_accuracy_batch(prefixes[:num_prefixes])
+    for (_, name, _), prefix, (av, at), e in zip(r, prefixes, accuracies, energies):
+        score = ml_state.weighted_score(av, e)
+        print("best at {} {} {} {} {}{}".format(name, score, av, at, e, s.describe_variances(prefix)))
 
 ###########################################
 
@@ -0,0 +1,80 @@
+#
+# File: pareto.py
+# Description: an external archive of the nondominated points found during a search.
+# The points have two objectives: accuracy (higher is better) and energy (lower is better).
+#
+
+import bisect
+import numpy as np
+
+###########################################
+
+#
+# The crowding distance of each point of a front, given as a (num_points, 2) array sorted along the front:
+# the sum of the distances between its neighbours in each dimension. The extreme points are never crowded.
+#
+def crowding_distances(points):
+    d = np.abs(np.diff(points, axis=0))
+    result = np.full(len(points), float("inf"))
+    result[1:-1] = (d[:-1] + d[1:]).sum(axis=1)
+    return result
+
+###########################################
+
+#
+# The points are kept sorted by energy. Nondominated points with more energy also have higher accuracy,
+# so a new point is dominated iff the point with the most energy not above its energy is at least as accurate.
+# That is a single bisection, and the points it dominates in turn are the ones right after it.
+# When there are more than `max_size` points, the most crowded ones are removed.
+#
+class ParetoArchive(object):
+    def __init__(self, max_size = None):
+        self.max_size = max_size
+        self.energies = []
+        self.accuracies = []
+        # the data of each point, e.g. the subset
+        self.data = []
+
+    def __len__(self):
+        return len(self.energies)
+
+    # whether some point in the archive is at least as accurate, with no more energy
+    def is_dominated(self, accuracy, energy):
+        i = bisect.bisect_right(self.energies, energy)
+        return i > 0 and self.accuracies[i - 1] >= accuracy
+
+    # returns True if the point was added
+    def add(self, accuracy, energy, data):
+        if self.is_dominated(accuracy, energy):
+            return False
+        i = bisect.bisect_right(self.energies, energy)
+        # remove the points with no less energy and no more accuracy
+        j = i
+        while j > 0 and self.energies[j - 1] == energy:
+            j -= 1
+        end = j
+        while end < len(self.energies) and self.accuracies[end] <= accuracy:
+            end += 1
+        self.energies[j:end] = [energy]
+        self.accuracies[j:end] = [accuracy]
+        self.data[j:end] = [data]
+        if self.max_size is not None and len(self) > self.max_size:
+            self.prune()
+        return True
+
+    def prune(self):
+        distances = crowding_distances(np.stack((self.accuracies, self.energies), axis=1))
+        i = int(np.argmin(distances))
+        del self.energies[i]
+        del self.accuracies[i]
+        del self.data[i]
+
+    # the indexes of the `num` least crowded points, in the order of decreasing accuracy for the equally crowded ones
+    def least_crowded(self, num):
+        order = np.arange(len(self))[::-1]
+        distances = crowding_distances(np.stack((self.accuracies, self.energies), axis=1))[order]
+        return order[np.argsort(-distances, kind="stable")[:num]]
+
+    # the indexes in the order of decreasing accuracy
+    def by_accuracy(self):
+        return list(range(len(self) - 1, -1, -1))
@@ -10,9 +10,14 @@
 #
 
 import os
+import io
+import queue
+import bisect
+import json
+import contextlib
+import multiprocessing
+import multiprocessing.managers
 import numpy as np
-import random
-import copy
 
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import f1_score
@@ -25,6 +30,8 @@ import utils
 import energy_model
 from ml_config import *
 import ml_state
+import score_cache
+import pareto
 
 ###########################################
 
@@ -55,493 +62,836 @@ VMAX = 0.6   # 6 in the other one
 # for multiobjective
 NUM_DIMENSIONS = 2
 
+# the seed of the random number generator; None for a different run each time
+RANDOM_SEED = None
+
+# the max number of (particle, leader) distances computed at once when selecting the global best
+MAX_DISTANCE_CHUNK = 1 << 22
+
+# save the state of the swarm in a checkpoint file after this many iterations
+# (each checkpoint has all the evaluated positions, so do not write it too often)
+CHECKPOINT_INTERVAL = 10
+
+# Early stop: stop when the hypervolume of the front (accuracy vs energy, up to the energy for raw data)
+# has not improved by more than HV_MIN_IMPROVEMENT (relative) in HV_PATIENCE iterations; None to never stop early
+HV_PATIENCE = 10
+HV_MIN_IMPROVEMENT = 0.001
+
+# the max number of points in the external Pareto archive; None for no limit
+ARCHIVE_MAX_SIZE = 1000
+
+# the max number of evaluated positions kept in the cache; None for no limit
+CACHE_MAX_ENTRIES = None
+# which position to evict when the cache is full: the least recently used ("lru"), or the least accurate ("worst")
+CACHE_EVICTION = score_cache.EVICT_LRU
+
+# in the island mode: migrate every this many iterations
+MIGRATION_INTERVAL = 5
+# in the island mode: the number of least crowded archive points that each island sends to the next one
+MIGRATION_SIZE = 10
+
 ###########################################
 
-class Particle(object):
-    def __init__(self, s, num_features):
+#
+# The swarm is stored as arrays with one row per particle, and moved as a whole.
+#
+class Swarm(object):
+    # the per-particle arrays
+    fields = ["x", "v", "personal_best", "score", "best_score", "best_av", "best_at", "av", "at", "e"]
+
+    def __init__(self, s):
         self.s = s
-        self.num_features = num_features
-        self.config = None
+        self.num_features = s.num_features
 
-    def setup(self):
-        if self.config:
-            self.x = []
-            for i in range(self.num_features):
-                if i in self.config:
-                    self.x.append(1)
-                else:
-                    self.x.append(0)
+    def __len__(self):
+        return len(self.x)
+
+    # `positions`: if not None, start from these positions instead, e.g. the ones of migrants from another swarm
+    def setup(self, configs, num_particles, positions=None):
+        rng = self.s.rng
+        if positions is not None:
+            self.x = positions.copy()
         else:
-            # Initialize position in range 0..+1
-            self.x = [1 if random.random() < INITIAL_PROB else 0 for _ in range(self.num_features)]
+            # Initialize position in range 0..+1; start from the given configs, if any
+            self.x = (rng.random((num_particles, self.num_features)) < INITIAL_PROB).astype(float)
+            for i, config in enumerate(configs):
+                self.x[i] = 0.0
+                self.x[i, list(config)] = 1.0
         # Initialize velocity in range -1..+1
-        self.v = [2 * random.random() - 1.0 for _ in range(self.num_features)]
+        self.v = 2 * rng.random(self.x.shape) - 1.0
         # Initialize the particle's best known position to its initial position
-        self.personal_best = copy.copy(self.x)
+        self.personal_best = self.x.copy()
         # Initialize scores to nothing
-        self.score = float("-inf")
-        self.best_score = float("-inf")
-        self.best_av = float("-inf")
-        self.best_at = float("-inf")
-
-    def move(self):
+        self.score = np.full(num_particles, float("-inf"))
+        self.best_score = np.full(num_particles, float("-inf"))
+        self.best_av = np.full(num_particles, float("-inf"))
+        self.best_at = np.full(num_particles, float("-inf"))
+        # the metrics of the current positions
+        self.av = np.full(num_particles, float("-inf"))
+        self.at = np.full(num_particles, float("-inf"))
+        self.e = np.full(num_particles, float("inf"))
+
+    def take(self, rows):
+        r = self.__class__(self.s)
+        for name in self.fields:
+            setattr(r, name, getattr(self, name)[rows])
+        return r
+
+    def copy(self):
+        return self.take(np.arange(len(self)))
+
+    def concatenate(self, other):
+        r = self.__class__(self.s)
+        for name in self.fields:
+            setattr(r, name, np.concatenate((getattr(self, name), getattr(other, name))))
+        return r
+
+    def update_position(self):
+        self.x += self.v
+        np.clip(self.x, 0.0, 1.0, out=self.x)
+
+    def clip_velocity(self):
+        np.clip(self.v, -VMAX, VMAX, out=self.v)
+
+    def move(self, gbest):
         # update position
-        s = sum(1 for xi in self.x if xi >= SELECTION_THRESHOLD)
-        for i in range(self.num_features):
-            self.x[i] += self.v[i]
-            if self.x[i] < 0.0:
-                self.x[i] = 0.0
-            elif self.x[i] > 1.0:
-                self.x[i] = 1.0
-        e = sum(1 for xi in self.x if xi >= SELECTION_THRESHOLD)
-        #print("before:", s, "after", e)
-        #print("d=", s - e)
+        self.update_position()
 
         # update speed
-        for i in range(self.num_features):
-            d1 = self.personal_best[i] - self.x[i]
-            d2 = self.s.best_particle.personal_best[i] - self.x[i]
-            r1 = random.random()
-            r2 = random.random()
-            v_new = W * self.v[i] + C1 * r1 * d1 + C2 * r2 * d2
-            #print(v_new, "=", "0.7 *", self.v[i], "+ 1.4 * ", r1, "*", d1 , "+ 1.4 * ", r2, "*", d2)
-            self.v[i] = v_new
-            if self.v[i] > VMAX:
-                self.v[i] = VMAX
-            elif self.v[i] < -VMAX:
-                self.v[i] = -VMAX
-
-    def get_indexes(self):
-        result = []
-        for i in range(self.num_features):
-            if self.x[i] >= SELECTION_THRESHOLD:
-                result.append(i)
-        return tuple(result)
+        rng = self.s.rng
+        r1 = rng.random(self.x.shape)
+        r2 = rng.random(self.x.shape)
+        d1 = self.personal_best - self.x
+        d2 = self.personal_best[gbest] - self.x
+        self.v = W * self.v + C1 * r1 * d1 + C2 * r2 * d2
+        self.clip_velocity()
+
+    def row_indexes(self, i):
+        return tuple(np.flatnonzero(self.x[i] >= SELECTION_THRESHOLD).tolist())
+
+    # the selected groups of each particle, as integer bitmasks
+    def get_keys(self):
+        selected = self.x >= SELECTION_THRESHOLD
+        # pack the bits in whole 64-bit words, and combine the words
+        num_words = (self.num_features + 63) // 64
+        packed = np.zeros((len(self), num_words * 8), dtype=np.uint8)
+        packed[:,:(self.num_features + 7) // 8] = np.packbits(selected, axis=1, bitorder="little")
+        words = packed.view("<u8")
+        keys = words[:,0].tolist()
+        for j in range(1, num_words):
+            keys = [key | (word << (64 * j)) for key, word in zip(keys, words[:,j].tolist())]
+        return keys
 
     def eval(self):
-        indexes = self.get_indexes()
-        self.score, av, at = self.s.score(indexes)
+        keys = self.get_keys()
+        self.av, self.at, self.e = self.s.eval_batch(keys).T
+        self.score = np.array([ml_state.weighted_score(a, b) for a, b in zip(self.av, self.e)])
+        self.update_archive(keys)
         # If the new position is better than best, take note of that
-        if self.score > self.best_score:
-            self.personal_best = copy.copy(self.x)
-            self.best_score = self.score
-            self.best_av = av
-            self.best_at = at
-
-    def __str__(self):
-        indexes = self.get_indexes()
-        names = sorted([self.s.groups[i] for i in indexes])
-
-        av, at = self.s.eval_accuracy(indexes)
-        e = self.s.eval_energy(indexes)
-
-        return " Particle with #features={} accuracy={:.4f}/{:.4f} energy={:.4f} score={:.4f} features=[{}]".format(
-            len(names), av, at, e, self.score, ",".join(names))
-
-    def get_mscore():
-        indexes = self.get_indexes()
-        return (self.s.eval_accuracy(indexes), self.s.eval_energy(indexes))
+        better = self.score > self.best_score
+        self.personal_best[better] = self.x[better]
+        self.best_score[better] = self.score[better]
+        self.best_av[better] = self.av[better]
+        self.best_at[better] = self.at[better]
+
+    # offer the evaluated positions to the external archive, in score units
+    def update_archive(self, keys):
+        archive = self.s.archive
+        for i, key in enumerate(keys):
+            if ml_state.is_rejected(self.av[i]):
+                # not evaluated on all of the data
+                continue
+            accuracy = roundacc(W_ACCURACY * self.av[i])
+            energy = -W_ENERGY * self.e[i]
+            if not archive.is_dominated(accuracy, energy):
+                archive.add(accuracy, energy, (key, self.av[i], self.at[i], self.e[i], self.x[i].copy()))
+
+    def describe(self, i):
+        indexes = self.row_indexes(i)
+        names = sorted([self.s.groups[j] for j in indexes])
+        return " Particle with #features={} accuracy={:.4f}/{:.4f} energy={:.4f} score={:.4f} features=[{}]{}".format(
+            len(names), self.av[i], self.at[i], self.e[i], self.score[i], ",".join(names),
+            self.s.describe_variances(indexes))
 
 ###########################################
 
-def copy_moparticle(p):
-    r = MultiObjectiveParticle(p.s, p.num_features)
-    r.x = copy.copy(p.x)
-    r.v = copy.copy(p.v)
-    r.personal_best = []
-    r.personal_best.append(copy.copy(p.personal_best[0]))
-    r.personal_best.append(copy.copy(p.personal_best[1]))
-    r.score = copy.copy(p.score)
-    r.best_score = copy.copy(p.best_score)
-    r.best_av = p.best_av
-    r.best_at = p.best_at
-    return r
-
-class MultiObjectiveParticle(Particle):
-    def __init__(self, s, num_features):
-        super(MultiObjectiveParticle, self).__init__(s, num_features)
-
-    def setup(self):
-        if self.config:
-            self.x = []
-            for i in range(self.num_features):
-                if i in self.config:
-                    self.x.append(1)
-                else:
-                    self.x.append(0)
-        else:
-            # Initialize position in range 0..+1
-            self.x = [1 if random.random() < INITIAL_PROB else 0 for _ in range(self.num_features)]
-        # Initialize velocity in range -1..+1
-        self.v = [2 * random.random() - 1.0 for _ in range(self.num_features)]
-        # Initialize the particle's best known position to its initial position
-        self.personal_best = []
-        self.personal_best.append(copy.copy(self.x))
-        self.personal_best.append(copy.copy(self.x))
+class MultiObjectiveSwarm(Swarm):
+    def setup(self, configs, num_particles, positions=None):
+        super().setup(configs, num_particles, positions)
+        # two personal best positions per particle: the most accurate and the one with the least energy
+        self.personal_best = np.stack((self.x, self.x), axis=1)
         # Initialize scores to nothing
-        self.score = [float("-inf"), float("inf")]
-        self.best_score = copy.copy(self.score)
-        self.best_av = float("-inf")
-        self.best_at = float("-inf")
-        self.av = float("-inf")
-        self.at = float("-inf")
+        self.score = np.tile([float("-inf"), float("inf")], (num_particles, 1))
+        self.best_score = self.score.copy()
 
     def eval(self):
-        indexes = self.get_indexes()
-        self.score, self.av, self.at = self.s.mscore(indexes)
+        keys = self.get_keys()
+        self.av, self.at, self.e = self.s.eval_batch(keys).T
+        self.score = np.empty((len(self), NUM_DIMENSIONS))
+        self.score[:,0] = [roundacc(W_ACCURACY * a) for a in self.av]
+        self.score[:,1] = W_ENERGY * self.e
+        self.update_archive(keys)
         # convert back to nonscaled metrics
-        a = self.score[0] / W_ACCURACY
-        e = self.score[1] / W_ENERGY
+        a = self.score[:,0] / W_ACCURACY
+        e = self.score[:,1] / W_ENERGY
         # bigger accuracy is better
-        if a > self.best_score[0]:
-            #print("update acc score: from ", self.best_score[0], "to", a)
-            self.personal_best[0] = copy.copy(self.x)
-            self.best_score[0] = a
-            self.best_av = self.av
-            self.best_at = self.at
+        better = a > self.best_score[:,0]
+        self.personal_best[better, 0] = self.x[better]
+        self.best_score[better, 0] = a[better]
+        self.best_av[better] = self.av[better]
+        self.best_at[better] = self.at[better]
         # smaller energy is better
-        if e < self.best_score[1]:
-            #print("update energy score: from ", self.best_score[1], "to", e)
-            self.personal_best[1] = copy.copy(self.x)
-            self.best_score[1] = e
-
-    def __str__(self):
-        indexes = self.get_indexes()
-        names = sorted([self.s.groups[i] for i in indexes])
-        e = self.score[1] / W_ENERGY
-        return " Particle with #features={} accuracy={:.4f}/{:.4f} energy={:.4f} features=[{}]".format(
-            len(names), self.av, self.at, e, ",".join(names))
-
-    def __repr__(self):
-        return str(self)
-
-    # distance in result space
-    def result_distance(self, other):
-        d1 = self.score[0] - other.score[0]
-        d2 = self.score[1] - other.score[1]
-        # return squared distance: good enough for comparison
-        return d1 * d1 + d2 * d2
-
-    def move(self, all_gbest):
+        better = e < self.best_score[:,1]
+        self.personal_best[better, 1] = self.x[better]
+        self.best_score[better, 1] = e[better]
+
+    def describe(self, i):
+        return describe_point(self.s, self.row_indexes(i), self.av[i], self.at[i], self.e[i])
+
+    # for each particle, the closest leader in result space
+    def closest(self, leader_scores):
+        result = np.empty(len(self), dtype=int)
+        chunk = max(1, MAX_DISTANCE_CHUNK // max(1, len(leader_scores)))
+        for start in range(0, len(self), chunk):
+            d = self.score[start:start+chunk,None,:] - leader_scores[None,:,:]
+            # squared distance: good enough for comparison
+            result[start:start+chunk] = np.argmin((d * d).sum(axis=2), axis=1)
+        return result
+
+    def move(self, leader_scores, leader_positions):
         # update position
-        s = sum(1 for xi in self.x if xi >= SELECTION_THRESHOLD)
-        for i in range(self.num_features):
-            self.x[i] += self.v[i]
-            if self.x[i] < 0.0:
-                self.x[i] = 0.0
-            elif self.x[i] > 1.0:
-                self.x[i] = 1.0
-        e = sum(1 for xi in self.x if xi >= SELECTION_THRESHOLD)
-        #print("before:", s, "after", e)
-        #print("d=", s - e)
+        self.update_position()
 
         self.eval()
 
         # select one of the globally best particles to look up to
-        if 0:
-            gbest = random.choice(all_gbest)
-        else:
-            mindist = float("inf")
-            gbest = None
-            for g in all_gbest:
-                d = self.result_distance(g)
-                if d < mindist:
-                    mindist = d
-                    gbest = g
-
-        # update speed 
-        for i in range(self.num_features):
-            d11 = self.personal_best[0][i] - self.x[i]
-            d12 = self.personal_best[1][i] - self.x[i]
-            if 0:
-                # use best coordinates
-                d21 = gbest.personal_best[0][i] - self.x[i]
-                d22 = gbest.personal_best[1][i] - self.x[i]
-            else:
-                # use current coordinates
-                d21 = gbest.x[i] - self.x[i]
-                d22 = d21
-            r1 = random.random()
-            r2 = random.random()
-            if 0:
-                v_new = W * self.v[i] + C1 * r1 * (d11 + d12) + C2 * r2 * (d21 + d22)
-            else:
-                if random.random() > 0.5:
-                    v_new = W * self.v[i] + C1 * r1 * d11 + C2 * r2 * d21
-                else:
-                    v_new = W * self.v[i] + C1 * r1 * d12 + C2 * r2 * d22
-
-            #print(v_new, "=", "0.7 *", self.v[i], "+ 1.4 * ", r1, "*", d1 , "+ 1.4 * ", r2, "*", d2)
-            self.v[i] = v_new
-            if self.v[i] > VMAX:
-                self.v[i] = VMAX
-            elif self.v[i] < -VMAX:
-                self.v[i] = -VMAX
-        #print(["{:.2f}".format(x) for x in self.v])
-
+        gbest = leader_positions[self.closest(leader_scores)]
+
+        # update speed, using the coordinates of the global best when it was archived
+        rng = self.s.rng
+        r1 = rng.random(self.x.shape)
+        r2 = rng.random(self.x.shape)
+        # in each dimension, follow either the most accurate or the least energy personal best
+        use_accuracy = rng.random(self.x.shape) > 0.5
+        personal_best = np.where(use_accuracy, self.personal_best[:,0], self.personal_best[:,1])
+        d1 = personal_best - self.x
+        d2 = gbest - self.x
+        self.v = W * self.v + C1 * r1 * d1 + C2 * r2 * d2
+        self.clip_velocity()
+
+def describe_point(s, indexes, av, at, e):
+    names = sorted([s.groups[j] for j in indexes])
+    return " Particle with #features={} accuracy={:.4f}/{:.4f} energy={:.4f} features=[{}]{}".format(
+        len(names), av, at, e, ",".join(names), s.describe_variances(indexes))
 
 ###########################################
 
-def make_particle(s, is_multi):
-    if is_multi:
-        return MultiObjectiveParticle(s, s.num_features)
-    return Particle(s, s.num_features)
-
-def make_particle_from_config(s, config, is_multi):
-    if is_multi:
-        p = MultiObjectiveParticle(s, s.num_features)
-    else:
-        p = Particle(s, s.num_features)
-    p.config = list(config)
-    return p
+#
+# The exact hypervolume in 2-D: the area dominated by the points with accuracy `av` and energy `e`,
+# up to the reference point with zero accuracy and `reference_energy`.
+# Going by increasing energy, each point adds a rectangle with the best accuracy so far.
+#
+def hypervolume(av, e, reference_energy):
+    within = e < reference_energy
+    order = np.argsort(e[within], kind="stable")
+    energy = e[within][order]
+    best_accuracy = np.maximum.accumulate(np.maximum(av[within][order], 0.0))
+    widths = np.diff(np.append(energy, reference_energy))
+    return float((widths * best_accuracy).sum())
 
 ###########################################
 
 class PSOState(ml_state.State):
     def __init__(self):
         super().__init__()
-        # global best of the swarm
+        self.rng = np.random.default_rng(RANDOM_SEED)
+        # the positions are cached here, so do not cache the accuracy in the state too
+        self.accuracy_cache = None
+        # if not None: the positions over this energy budget are not evaluated, just given zero accuracy
+        self.budget = None
+        self.checkpoint_filename = None
+        # if not None: a `SharedScores` proxy, for sharing the evaluated positions between parallel runs
+        self.shared_cache = None
+        self.num_particles = NUM_PARTICLES
+        # in the island mode: the number of this island and of all islands,
+        # and the queues for receiving migrants from the previous island and sending them to the next one
+        self.island = 0
+        self.num_islands = 1
+        self.inbox = None
+        self.outbox = None
+        self.reset()
+
+    # clear the results of a run, so that the loaded state can be used for another one
+    def reset(self):
+        self.swarm = None
+        # global best of the swarm: row in `swarm`
         self.best_particle = None
-        # already evaluated positions
-        self.cache = {}
-        # already evaluated positions: vector of scores for multi-objective optimization
-        self.mcache = {}
+        # already evaluated positions: the (av, at, e) of each, keyed by bitmask
+        self.cache = score_cache.ScoreCache(3, CACHE_MAX_ENTRIES, CACHE_EVICTION)
+        self.num_skipped = 0
+        # the most accurate position within the budget, as a (av, at, e, indexes) tuple
+        self.best_feasible = None
+        # the nondominated positions found so far
+        self.archive = pareto.ParetoArchive(ARCHIVE_MAX_SIZE)
+        # for the early stop: the best hypervolume so far, and the number of iterations without enough improvement
+        self.best_hypervolume = 0.0
+        self.num_stalled = 0
+        self.reset_progressive_sampling()
+        self.accuracy_variances = {}
+
+    # the cached scores also depend on the budget, and the saved swarm on its size (per island in the island mode)
+    def settings(self):
+        settings = super().settings()
+        settings["budget"] = self.budget
+        settings["num_particles"] = self.num_particles
+        return settings
+
+    # evaluate many positions, given as bitmasks: the ones not seen before are deduplicated and evaluated in parallel.
+    # Returns an array with the (av, at, e) of each position
+    def eval_batch(self, keys):
+        position = {}
+        missing = []
+        # the cache entries can be evicted while adding new ones, so copy the results here
+        results = np.empty((len(keys), 3))
+        for key in keys:
+            if key in position:
+                continue
+            position[key] = len(position)
+            values = self.cache.get(key)
+            if values is None:
+                missing.append(key)
+            else:
+                results[position[key]] = values
+
+        if len(missing):
+            new_values = self.eval_missing(missing)
+            for key, values in zip(missing, new_values):
+                av, at, e = values
+                results[position[key]] = values
+                self.cache.put(key, values)
+                if self.budget is not None and e <= self.budget:
+                    if self.best_feasible is None or av > self.best_feasible[0]:
+                        self.best_feasible = (av, at, e, utils.bitmask_to_subset(key))
+        return results[[position[key] for key in keys]]
+
+    # the (av, at, e) of the positions that are not in the cache
+    def eval_missing(self, keys):
+        shared = self.shared_cache.get_many(keys) if self.shared_cache is not None else [None] * len(keys)
+        unknown = [key for key, values in zip(keys, shared) if values is None]
+        new_values = {}
+        if len(unknown):
+            list_of_indexes = [utils.bitmask_to_subset(key) for key in unknown]
+            energies = self.eval_energy_batch(list_of_indexes)
+            # the energy is cheap to compute, so no need to train the classifier for the positions over the budget
+            within = [indexes for indexes, e in zip(list_of_indexes, energies) if self.budget is None or e <= self.budget]
+            self.num_skipped += len(unknown) - len(within)
+            accuracies = dict(zip(within, self.eval_accuracy_batch(within)))
+            for key, indexes, e in zip(unknown, list_of_indexes, energies):
+                av, at = accuracies.get(indexes, (0.0, 0.0))
+                new_values[key] = (av, at, float(e))
+            if self.shared_cache is not None:
+                self.shared_cache.put_many(new_values)
+        return [values if values is not None else new_values[key] for key, values in zip(keys, shared)]
+
+    # the least crowded 3/4 of the archive, as the "highest ranked (least crowded) solutions in nonDomS" from the paper;
+    # returns their scores and positions
+    def get_leaders(self):
+        rows = self.archive.least_crowded((3 * len(self.archive) + 3) // 4)
+        scores = np.array([[self.archive.accuracies[i], -self.archive.energies[i]] for i in rows])
+        positions = np.array([self.archive.data[i][4] for i in rows])
+        return scores, positions
+
+    def print_archive(self):
+        for i in self.archive.by_accuracy():
+            key, av, at, e, x = self.archive.data[i]
+            print(" ", describe_point(self, utils.bitmask_to_subset(key), av, at, e))
+
+    # the archive as a list of (key, av, at, e) tuples
+    def archive_points(self):
+        return [data[:4] for data in self.archive.data]
+
+    def update_hypervolume(self):
+        hv = hypervolume(self.swarm.av, self.swarm.e, self.energy_for_raw)
+        print("Hypervolume: {:.6f}".format(hv))
+        if hv > self.best_hypervolume * (1.0 + HV_MIN_IMPROVEMENT):
+            self.num_stalled = 0
+        else:
+            self.num_stalled += 1
+        self.best_hypervolume = max(self.best_hypervolume, hv)
+
+    def has_converged(self):
+        if HV_PATIENCE is None or self.num_stalled < HV_PATIENCE:
+            return False
+        print("stopping: the hypervolume improved by less than {}% in the last {} iterations".format(
+              100 * HV_MIN_IMPROVEMENT, self.num_stalled))
+        return True
+
+    def print_budget_result(self):
+        if self.budget is None:
+            return
+        if self.best_feasible is not None:
+            av, at, e, indexes = self.best_feasible
+            print("most accurate subset within the budget", av, at, e, [self.groups[x] for x in indexes])
+        print("number of positions over the budget of {:.4f}: {}".format(self.budget, self.num_skipped))
 
     def init_particles(self, is_multi):
-        self.particles = []
-
+        configs = []
         if INITIALIZE_WITH_ALL_PAIRS:
             # initialize with all possible pairs of particles
             for i in range(self.num_features):
                 for j in range(i + 1, self.num_features):
-                    indexes = (i, j)
-                    self.particles.append(make_particle_from_config(self, indexes, is_multi))
-                    if len(self.particles) >= NUM_PARTICLES:
-                        break
-                if len(self.particles) >= NUM_PARTICLES:
-                        break
-            #print("num particles=", len(self.particles))
-
-        # Initialize with extra, random particles
-        while len(self.particles) < NUM_PARTICLES:
-            self.particles.append(make_particle(self, is_multi))
+                    configs.append((i, j))
+            # each island starts from different pairs
+            configs = configs[self.island::self.num_islands][:self.num_particles]
+
+        # the rest are initialized with extra, random particles
+        self.swarm = MultiObjectiveSwarm(self) if is_multi else Swarm(self)
+        self.swarm.setup(configs, self.num_particles)
 
         # Get initial score
-        for p in self.particles:
-            p.setup()
-            p.eval()
-        # Initialize the new global best
-        self.best_particle = self.particles[0]
-        for p in self.particles[1:]:
-            if p.score > self.best_particle.best_score:
-                self.best_particle = p
-
-    def score(self, indexes):
-        # this was already seen?
-        if indexes not in self.cache:
-            av, at = self.eval_accuracy(indexes)
-            e = self.eval_energy(indexes)
-            score = roundacc(W_ACCURACY * av) + W_ENERGY * e
-            self.cache[indexes] = (score, av, at)
-        return self.cache[indexes]
-
-    def mscore(self, indexes):
-        # this was already seen?
-        if indexes not in self.mcache:
-            av, at = self.eval_accuracy(indexes)
-            e = self.eval_energy(indexes)
-            score = [roundacc(W_ACCURACY * av), W_ENERGY * e]
-            self.mcache[indexes] = (score, av, at)
-        return self.mcache[indexes]
-
-
-# Sorting functions
-def sort(s):
-    s.sort(key = lambda p: p.score, reverse=True)
-
-def nondominated_sort(s):
-    # sort by accuracy first (higher accuracy comes first)
-    # then energy (lower energy comes first)
-    s.sort(key = lambda p: p.score, reverse=True)
-    # this is the Pareto front
-    f1 = [s[0]]
-    rest = []
-    for i, candidate in enumerate(s[1:]):
-        in_front = True
-        # iterate for all particles that come before this one
-        for dom_part in f1:
-            # if this one has better energy, drop the candidate
-            if dom_part.score[1] >= candidate.score[1]:
-                in_front = False
+        self.swarm.eval()
+        self.best_hypervolume = hypervolume(self.swarm.av, self.swarm.e, self.energy_for_raw)
+        if not is_multi:
+            # Initialize the new global best
+            self.best_particle = 0
+            self.update_best_particle()
+
+    def update_best_particle(self):
+        # in the order of particles, like when evaluating them one by one
+        for i in range(len(self.swarm)):
+            if self.swarm.score[i] > self.swarm.best_score[self.best_particle]:
+                self.best_particle = i
+
+    #
+    # Save everything that the next iterations depend on, so that a resumed run gives the same results.
+    # `iteration` is the number of completed iterations.
+    #
+    def save_checkpoint(self, iteration):
+        if self.checkpoint_filename is None or iteration % CHECKPOINT_INTERVAL != 0:
+            return
+        keys = [key for key, values in self.cache.items()]
+        num_bytes = (self.num_features + 7) // 8
+        state = {
+            "is_multi" : isinstance(self.swarm, MultiObjectiveSwarm),
+            "groups" : np.array(self.groups),
+            "settings" : json.dumps(self.settings()),
+            "iteration" : iteration,
+            "rng" : json.dumps(self.rng.bit_generator.state),
+            "best_particle" : -1 if self.best_particle is None else self.best_particle,
+            "progressive_best" : np.array(self.progressive_best),
+            "num_skipped" : self.num_skipped,
+            "best_hypervolume" : self.best_hypervolume,
+            "num_stalled" : self.num_stalled,
+            # the bitmasks of the cache entries, one row of bytes each, in the order of use
+            "cache_keys" : np.frombuffer(b"".join(key.to_bytes(num_bytes, "little") for key in keys),
+                                         dtype=np.uint8).reshape(-1, num_bytes),
+            "cache_values" : np.array([values for key, values in self.cache.items()]).reshape(-1, 3),
+            "cache_counters" : np.array([self.cache.hits, self.cache.misses, self.cache.evictions]),
+            "variances" : json.dumps(self.saved_variances()),
+        }
+        if self.best_feasible is not None:
+            av, at, e, indexes = self.best_feasible
+            state["best_feasible"] = np.array([av, at, e])
+            state["best_feasible_indexes"] = np.array(indexes, dtype=int)
+        for name in self.swarm.fields:
+            state["swarm_" + name] = getattr(self.swarm, name)
+        archive = self.archive.data
+        state["archive_keys"] = np.frombuffer(b"".join(data[0].to_bytes(num_bytes, "little") for data in archive),
+                                              dtype=np.uint8).reshape(-1, num_bytes)
+        state["archive_values"] = np.array([data[1:4] for data in archive]).reshape(-1, 3)
+        state["archive_positions"] = np.array([data[4] for data in archive]).reshape(-1, self.num_features)
+        state["archive_objectives"] = np.array([self.archive.accuracies, self.archive.energies])
+        # write to a temporary file first, so that a crash does not corrupt the checkpoint
+        tmp_filename = self.checkpoint_filename + ".tmp"
+        with open(tmp_filename, "wb") as f:
+            np.savez(f, **state)
+        os.replace(tmp_filename, self.checkpoint_filename)
+
+    # returns the number of completed iterations, or None if there is nothing to resume from
+    def load_checkpoint(self, is_multi):
+        if self.checkpoint_filename is None or not os.access(self.checkpoint_filename, os.R_OK):
+            print("no checkpoint found, starting from scratch")
+            return None
+        with np.load(self.checkpoint_filename) as state:
+            return self.restore_checkpoint(state, is_multi)
+
+    def restore_checkpoint(self, state, is_multi):
+        if bool(state["is_multi"]) != is_multi or list(state["groups"]) != list(self.groups):
+            print("the checkpoint {} is for a different search, starting from scratch".format(self.checkpoint_filename))
+            return None
+        changed = self.changed_settings(json.loads(str(state["settings"])) if "settings" in state else {})
+        if len(changed):
+            print("the checkpoint {} was made with different settings ({}), starting from scratch".format(
+                  self.checkpoint_filename, ", ".join(changed)))
+            return None
+        self.rng.bit_generator.state = json.loads(str(state["rng"]))
+        best_particle = int(state["best_particle"])
+        self.best_particle = None if best_particle < 0 else best_particle
+        self.progressive_best = state["progressive_best"].tolist()
+        self.num_skipped = int(state["num_skipped"])
+        self.best_hypervolume = float(state["best_hypervolume"])
+        self.num_stalled = int(state["num_stalled"])
+        for key, values in zip(state["cache_keys"], state["cache_values"]):
+            self.cache.put(int.from_bytes(key.tobytes(), "little"), values)
+        self.cache.hits, self.cache.misses, self.cache.evictions = state["cache_counters"].tolist()
+        if "variances" in state:
+            self.restore_variances(json.loads(str(state["variances"])))
+        if "best_feasible" in state:
+            av, at, e = state["best_feasible"].tolist()
+            self.best_feasible = (av, at, e, tuple(state["best_feasible_indexes"].tolist()))
+        self.swarm = MultiObjectiveSwarm(self) if is_multi else Swarm(self)
+        for name in self.swarm.fields:
+            setattr(self.swarm, name, state["swarm_" + name])
+        self.archive.accuracies, self.archive.energies = state["archive_objectives"].tolist()
+        self.archive.data = [(int.from_bytes(key.tobytes(), "little"), av, at, e, x) for key, (av, at, e), x
+                             in zip(state["archive_keys"], state["archive_values"].tolist(), state["archive_positions"])]
+        iteration = int(state["iteration"])
+        print("resuming from {}: {} iterations done, {} positions evaluated".format(
+              self.checkpoint_filename, iteration, len(self.cache)))
+        return iteration
+
+    #
+    # Island mode: send the least crowded points of the archive to the next island, and take in
+    # the ones that arrived from the previous island. The migration is asynchronous, so the islands
+    # never wait for each other, and the ones that stop early do not hold up the rest.
+    # `iteration` is the number of completed iterations.
+    #
+    def migrate(self, iteration):
+        if self.outbox is None or iteration % MIGRATION_INTERVAL != 0:
+            return
+        rows = self.archive.least_crowded(MIGRATION_SIZE)
+        self.outbox.put(np.array([self.archive.data[i][4] for i in rows]))
+        received = []
+        while True:
+            try:
+                received.append(self.inbox.get_nowait())
+            except queue.Empty:
                 break
-        if in_front:
-            f1.append(candidate)
+        if len(received) == 0:
+            return
+        positions = np.concatenate(received)
+        print("received {} migrants".format(len(positions)))
+        is_multi = isinstance(self.swarm, MultiObjectiveSwarm)
+        migrants = MultiObjectiveSwarm(self) if is_multi else Swarm(self)
+        migrants.setup([], len(positions), positions)
+        migrants.eval()
+        if is_multi:
+            # compete with the particles of this island for the places in the swarm
+            union = self.swarm.concatenate(migrants)
+            self.swarm = union.take(select_particles(union.score, self.num_particles))
         else:
-            rest.append(candidate)
-    return f1, rest
+            # replace the particles with the worst scores, keeping the global best
+            order = np.argsort(self.swarm.score, kind="stable")
+            rows = order[order != self.best_particle][:len(migrants)]
+            for name in self.swarm.fields:
+                getattr(self.swarm, name)[rows] = getattr(migrants, name)[:len(rows)]
+            self.update_best_particle()
+
+    # sort the particles by their score, keeping track of the global best
+    def sort_particles(self):
+        order = np.argsort(-self.swarm.score, kind="stable")
+        self.swarm = self.swarm.take(order)
+        self.best_particle = int(np.flatnonzero(order == self.best_particle)[0])
 
 
-def sort_by_crowding(s):
-    for p in s:
-        p.crowding_distance = [0] * NUM_DIMENSIONS
+# Sorting functions: these take the (accuracy, energy) score arrays of all particles, and return row numbers
 
-    # `s` is assumed to be already sorted by score,
+#
+# Assign all particles to nondominated fronts in one pass, in O(n log n) time.
+# Going in the sorted order, each particle is put in the first front where it has better energy
+# than all particles before it. The max energy scores of the fronts are non-increasing, so that front is found with bisection.
+# Returns the fronts, each as an array of rows in the sorted order.
+#
+def nondominated_fronts(scores):
+    order = np.lexsort((-scores[:,1], -scores[:,0]))
+    ranks = np.empty(len(order), dtype=int)
+    # the max energy score in each front, negated to make it non-decreasing
+    front_max = []
+    for i, energy in zip(order, -scores[order,1]):
+        rank = bisect.bisect_right(front_max, energy)
+        if rank == len(front_max):
+            front_max.append(energy)
+        else:
+            front_max[rank] = energy
+        ranks[i] = rank
+
+    sorted_ranks = ranks[order]
+    grouped = order[np.argsort(sorted_ranks, kind="stable")]
+    return np.split(grouped, np.cumsum(np.bincount(sorted_ranks))[:-1])
+
+
+def sort_by_crowding(scores, front):
+    # `front` is assumed to be already sorted by score,
     # and, given that this is a Pareto front,
-    # if means that they will be sorted in all dimensions in the same time
-    for dimension in range(NUM_DIMENSIONS):
-        # calculate the crowding in this dimension
-        for i in range(len(s)):
-            if i == 0 or i == len(s) - 1:
-                s[i].crowding_distance[dimension] = float("inf")
-            else:
-                d1 = s[i].score[dimension] - s[i - 1].score[dimension]
-                d2 = s[i + 1].score[dimension] - s[i].score[dimension]
-                if dimension == 0:
-                    d1 = -d1
-                    d2 = -d2
-                assert d1 >= 0
-                assert d2 >= 0
-                s[i].crowding_distance[dimension] = d1 + d2
+    # if means that they will be sorted in all dimensions in the same time:
+    # the accuracy is decreasing, and the energy score increasing
+    d = np.diff(scores[front], axis=0)
+    assert (d[:,0] <= 0).all() and (d[:,1] >= 0).all()
+    crowding_distance = pareto.crowding_distances(scores[front])
     # the ones with higher crowding distance are better (less crowded)
-    return sorted(s, key = lambda p: sum(p.crowding_distance), reverse=True)
+    return front[np.argsort(-crowding_distance, kind="stable")]
+
+# the rows of the `num_particles` best particles: taking the fronts in the order of their rank
+def select_particles(scores, num_particles):
+    selected = []
+    for f1 in nondominated_fronts(scores):
+        if len(selected) >= num_particles:
+            break
+        if len(f1) + len(selected) <= num_particles:
+            # fits fully
+            selected += list(f1)
+        else:
+            # fits only partially: take the least crowded particles of this front
+            f1 = sort_by_crowding(scores, f1)
+            selected += list(f1[:num_particles - len(selected)])
+            break
+    return selected
 
 ###########################################
 
 #
 # Single-objective particle swarm optimization
 #
-def so_pso(dataset):
+def so_pso(dataset, budget=None, resume=False):
     print("Single objective")
     s = PSOState()
+    s.budget = budget
+    s.checkpoint_filename = get_checkpoint_filename(dataset, "s")
     print("Loading...")
     s.load(dataset)
-    print("Initializing starting positions and scores...")
-    s.init_particles(False)
-
-    print("Initialization done, initial Pareto front:")
-    sort(s.particles)
-    for p in s.particles[:10]:
-        print(" ", p)
-
-    for it in range(NUM_ITERATIONS):
+    run_so_pso(s, resume)
+
+# run on a loaded state; returns the final Pareto front as a list of (key, av, at, e) tuples
+def run_so_pso(s, resume):
+    start = s.load_checkpoint(False) if resume else None
+    if start is None:
+        print("Initializing starting positions and scores...")
+        s.init_particles(False)
+
+        print("Initialization done, initial Pareto front:")
+        s.sort_particles()
+        for i in range(min(10, len(s.swarm))):
+            print(" ", s.swarm.describe(i))
+        start = 0
+        s.save_checkpoint(start)
+
+    for it in range(start, NUM_ITERATIONS):
+        if s.has_converged():
+            break
         print("Iteration", it)
         # Move to a new position
-        for p in s.particles:
-            p.move()
+        s.swarm.move(s.best_particle)
         # Evaluate in the new position
-        for p in s.particles:
-            p.eval()
-        for p in s.particles:
-            # check if there's a new global best
-            if p.score > s.best_particle.best_score:
-                # update the global best
-                #print("new gb")
-                s.best_particle = p
-        print("Best: {}".format(s.best_particle))
-
-    sort(s.particles)
-    for p in s.particles:
-        print(p)
+        s.swarm.eval()
+        # check if there's a new global best
+        s.update_best_particle()
+        s.migrate(it + 1)
+        print("Best: {}".format(s.swarm.describe(s.best_particle)))
+        s.update_hypervolume()
+        s.save_checkpoint(it + 1)
+
+    s.sort_particles()
+    for i in range(len(s.swarm)):
+        print(s.swarm.describe(i))
 
     print("\nFinal Pareto front")
-    # treat as multidimensional optimization and find the Pareto front
-    mp = []
-    seen_indexes = set()
-    for p in s.particles:
-        mp.append(MultiObjectiveParticle(s, s.num_features))
-        mp[-1].setup()
-        indexes = mp[-1].get_indexes()
-        if indexes in seen_indexes:
-            continue # already have this particle
-        seen_indexes.add(indexes)
-        mp[-1].x = p.x
-        mp[-1].eval()
-
-    f1, _ = nondominated_sort(mp)
-    for p in f1:
-        print(" ", p)
+    # treat as multidimensional optimization: the archive has the Pareto front of all evaluated positions
+    s.print_archive()
     print("")
+    s.print_budget_result()
+    print(s.cache.stats())
+    return s.archive_points()
 
 ###########################################
 
 #
 # Multi-objective particle swarm optimization based on nondominant sorting ideas
 #
-def mo_pso(dataset):
+def mo_pso(dataset, budget=None, resume=False):
     print("Multi objective")
     s = PSOState()
+    s.budget = budget
+    s.checkpoint_filename = get_checkpoint_filename(dataset, "m")
     print("Loading...")
     s.load(dataset)
-    print("Initializing starting positions and scores...")
-    s.init_particles(True)
-
-    print("Initialization done, initial Pareto front:")
-    f1, rest = nondominated_sort(s.particles)
-    for p in f1:
-        print(" ", p)
-
-    for it in range(NUM_ITERATIONS):
+    run_mo_pso(s, resume)
+
+# run on a loaded state; returns the final Pareto front as a list of (key, av, at, e) tuples
+def run_mo_pso(s, resume):
+    start = s.load_checkpoint(True) if resume else None
+    if start is None:
+        print("Initializing starting positions and scores...")
+        s.init_particles(True)
+
+        print("Initialization done, initial Pareto front:")
+        s.print_archive()
+        start = 0
+        s.save_checkpoint(start)
+
+    for it in range(start, NUM_ITERATIONS):
+        if s.has_converged():
+            break
         print("Iteration", it)
 
-        f1, _ = nondominated_sort(s.particles)
-        f1 = sort_by_crowding(f1)
-        # take half of F1 as the "highest ranked (least crowded) solutions in nonDomS" from the paper
-        num_to_take = (3 * len(f1) + 3) // 4
-        highest_ranked_f1 = f1[:num_to_take]
-
-        union = []
-        for p in s.particles:
-            # Insert the particle with the old position and score
-            union.append(p)
-            # Create a new particle based on the old one
-            p1 = copy_moparticle(p)
-            # Move to a new position
-            p1.move(highest_ranked_f1)
-            # Insert the particle with the new position
-            union.append(p1)
-
-        # start afresh
-        s.particles = []
-        while len(s.particles) < NUM_PARTICLES:
-            f1, rest = nondominated_sort(union)
-            if len(f1) + len(s.particles) <= NUM_PARTICLES:
-                # fits fully
-                s.particles += f1
-            else:
-                # fits only partially
-                f1 = sort_by_crowding(f1)
-                i = 0
-                while len(s.particles) < NUM_PARTICLES:
-                    s.particles.append(f1[i])
-                break
-            # remove the F1 front from the union
-            union = [p for p in rest]
+        # Create new particles based on the old ones, and move them to new positions
+        moved = s.swarm.copy()
+        moved.move(*s.get_leaders())
+        # The particles with the old positions and scores, and the ones with the new positions
+        union = s.swarm.concatenate(moved)
+
+        # start afresh, taking the fronts in the order of their rank
+        s.swarm = union.take(select_particles(union.score, s.num_particles))
+        s.migrate(it + 1)
+        s.update_hypervolume()
+        s.save_checkpoint(it + 1)
 
     print("Final Pareto front:")
-    f1, _ = nondominated_sort(s.particles)
-    for p in f1:
-        print(" ", p)
+    s.print_archive()
+    s.print_budget_result()
+    print(s.cache.stats())
+    return s.archive_points()
 
 ###########################################
 
+#
+# The evaluated positions shared between parallel runs. The runs look up the positions they have not seen
+# in batches, and add the ones they evaluate, so there is one round trip to the manager process for each.
+#
+class SharedScores(object):
+    def __init__(self):
+        self.scores = {}
+
+    def get_many(self, keys):
+        return [self.scores.get(key) for key in keys]
+
+    def put_many(self, scores):
+        self.scores.update(scores)
+
+    def size(self):
+        return len(self.scores)
+
+class ScoreManager(multiprocessing.managers.BaseManager):
+    pass
+
+ScoreManager.register("SharedScores", SharedScores)
+
+# the loaded state, shared with the run processes
+_multi_run_state = None
+# in the island mode: the migration queue of each island, inherited by the run processes
+_island_queues = None
+
+def _run_in_process(args):
+    run, seed, is_multi, resume, shared_cache = args
+    s = _multi_run_state
+    # there can be more runs than processes, so start from a clean state even if this process has done a run before
+    s.reset()
+    # the runs are the unit of parallelism, so evaluate serially in each of them
+    ml_state._is_worker = True
+    s.rng = np.random.default_rng(seed)
+    s.shared_cache = shared_cache
+    name = "island" if _island_queues is not None else "run"
+    s.checkpoint_filename = get_checkpoint_filename(s.dataset, "{}_{}{}".format("m" if is_multi else "s", name, run))
+    if _island_queues is not None:
+        # a ring: receive from the previous island, send to the next one
+        s.island = run
+        s.num_islands = len(_island_queues)
+        s.num_particles = max(1, NUM_PARTICLES // s.num_islands)
+        s.inbox = _island_queues[run]
+        s.outbox = _island_queues[(run + 1) % s.num_islands]
+    # keep the log of each run together
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        if is_multi:
+            print("Multi objective")
+            front = run_mo_pso(s, resume)
+        else:
+            print("Single objective")
+            front = run_so_pso(s, resume)
+    return output.getvalue(), front, s.saved_variances()
+
+#
+# Run `num_runs` independent runs in parallel, with different seeds, sharing the evaluated positions.
+# The log of each run is printed as it would be for a single run, followed by the merged Pareto front of all runs.
+#
+# With `islands`, the runs are islands of a single swarm of NUM_PARTICLES particles: each one moves its own part
+# of the swarm in its own process, and every MIGRATION_INTERVAL iterations sends its best nondominated positions
+# to the next island in a ring. All islands run at the same time, so use as many as there are cores.
+#
+def multi_run(dataset, num_runs, is_multi, budget=None, resume=False, islands=False):
+    global _multi_run_state, _island_queues
+    s = PSOState()
+    s.budget = budget
+    print("Loading...")
+    s.load(dataset)
+
+    seeds = np.random.SeedSequence(RANDOM_SEED).spawn(num_runs)
+    ctx = multiprocessing.get_context("fork")
+    if islands:
+        num_processes = num_runs
+        print("Starting {} islands of {} particles...".format(num_runs, max(1, NUM_PARTICLES // num_runs)))
+    else:
+        num_processes = min(num_runs, ml_state.get_num_workers())
+        print("Starting {} runs in {} processes...".format(num_runs, num_processes))
+    points = {}
+    with ScoreManager(ctx=ctx) as manager:
+        shared_cache = manager.SharedScores()
+        _multi_run_state = s
+        _island_queues = [ctx.Queue() for run in range(num_runs)] if islands else None
+        with ctx.Pool(num_processes) as pool:
+            args = [(run, seeds[run], is_multi, resume, shared_cache) for run in range(num_runs)]
+            for output, front, variances in pool.imap(_run_in_process, args):
+                print(output, end="")
+                s.restore_variances(variances)
+                for key, av, at, e in front:
+                    points[key] = (av, at, e)
+        _multi_run_state = None
+        _island_queues = None
+        print("{} positions evaluated in total".format(shared_cache.size()))
+
+    print("Merged Pareto front of all {}:".format("islands" if islands else "runs"))
+    merged = pareto.ParetoArchive()
+    for key, (av, at, e) in points.items():
+        merged.add(roundacc(W_ACCURACY * av), -W_ENERGY * e, (key, av, at, e))
+    for i in merged.by_accuracy():
+        key, av, at, e = merged.data[i]
+        print(" ", describe_point(s, utils.bitmask_to_subset(key), av, at, e))
+
+###########################################
+
+def get_checkpoint_filename(dataset, mode):
+    return "{}_pso_{}.checkpoint".format(os.path.basename(dataset).replace(" ", "_"), mode)
+
 def main():
+    args, options = utils.parse_args(sys.argv)
+    # pass `--resume` to continue from the last checkpoint
+    resume = "resume" in options
+    # pass `--budget=<uC>` to only consider the subsets within an energy budget
+    budget = utils.option_value(options, "budget", float, ENERGY_BUDGET)
+    # pass `--runs=<N>` to do N independent runs in parallel
+    num_runs = utils.option_value(options, "runs", int, 1)
+    # pass `--islands=<N>` to split the swarm in N islands, running in parallel and exchanging particles
+    num_islands = utils.option_value(options, "islands", int, 1)
+
     dataset = DEFAULT_DATASET
-    if len(sys.argv) > 1:
-        dataset = sys.argv[1]
+    if len(args) > 1:
+        dataset = args[1]
 
-    if len(sys.argv) > 2 and sys.argv[2] == "s":
+    if len(args) > 2 and args[2] == "s":
         do_single = True
     else:
         do_single = False
 
-    if do_single:
-        so_pso(dataset)
+    if num_islands > 1:
+        multi_run(dataset, num_islands, not do_single, budget, resume, islands=True)
+    elif num_runs > 1:
+        multi_run(dataset, num_runs, not do_single, budget, resume)
+    elif do_single:
+        so_pso(dataset, budget, resume)
     else:
-        mo_pso(dataset)
+        mo_pso(dataset, budget, resume)
 
 def har_multi():
-    for i in range(10):
-        mo_pso("UCI HAR Dataset")
+    multi_run("UCI HAR Dataset", 10, True)
 
 ###########################################
 
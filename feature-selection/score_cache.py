@@ -0,0 +1,94 @@
+#
+# File: score_cache.py
+# Description: a bounded cache of the scores of feature subsets.
+# The subsets are keyed by integer bitmasks (see `utils.subset_to_bitmask`), and the scores
+# are stored as rows of a single array, so the memory use stays flat over long runs.
+#
+
+import heapq
+import collections
+import numpy as np
+
+###########################################
+
+# when the cache is full, evict the least recently used entry
+EVICT_LRU = "lru"
+# when the cache is full, evict the entry with the smallest first value (e.g. the least accurate subset)
+EVICT_WORST = "worst"
+
+class ScoreCache(object):
+    def __init__(self, num_values, max_entries = None, eviction = EVICT_LRU):
+        if eviction not in (EVICT_LRU, EVICT_WORST):
+            raise ValueError("unknown eviction policy: {}".format(eviction))
+        self.num_values = num_values
+        self.max_entries = max_entries
+        self.eviction = eviction
+        # the row of each key in `values`, in the order of use
+        self.rows = collections.OrderedDict()
+        self.values = np.empty((max_entries if max_entries is not None else 1024, num_values))
+        self.free_rows = []
+        # (first value, key) of the entries, for the EVICT_WORST policy
+        self.heap = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    # returns the values of `key`, or None if it is not in the cache
+    def get(self, key):
+        row = self.rows.get(key)
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if self.eviction == EVICT_LRU:
+            self.rows.move_to_end(key)
+        return self.values[row]
+
+    def put(self, key, values):
+        row = self.rows.get(key)
+        if row is None:
+            if self.max_entries is not None and len(self.rows) >= self.max_entries:
+                self.evict()
+            row = self.allocate_row()
+            self.rows[key] = row
+            if self.eviction == EVICT_WORST:
+                heapq.heappush(self.heap, (values[0], key))
+        else:
+            self.rows.move_to_end(key)
+        self.values[row] = values
+
+    def allocate_row(self):
+        if len(self.free_rows):
+            return self.free_rows.pop()
+        row = len(self.rows)
+        if row == len(self.values):
+            # unbounded: grow the array
+            self.values = np.concatenate((self.values, np.empty(self.values.shape)))
+        return row
+
+    def evict(self):
+        if self.eviction == EVICT_LRU:
+            key, row = self.rows.popitem(last=False)
+        else:
+            # skip the heap entries of keys that were already evicted
+            while True:
+                _, key = heapq.heappop(self.heap)
+                if key in self.rows:
+                    break
+            row = self.rows.pop(key)
+        self.free_rows.append(row)
+        self.evictions += 1
+
+    def items(self):
+        for key, row in self.rows.items():
+            yield key, self.values[row]
+
+    def stats(self):
+        return "cache: {} entries, {} hits, {} misses, {} evictions".format(
+            len(self), self.hits, self.misses, self.evictions)
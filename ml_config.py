@@ -8,18 +8,49 @@ DEFAULT_DATASET = "UCI HAR Dataset"
 
 NUM_TREES = 100
 
+# the classifier used to evaluate feature subsets, see classifiers.py:
+#  "rf" - random forest (used in the paper);
+#  "binned_rf" - random forest trained on quantized features (about 1.3x faster per fit than "rf");
+#  "hgb" - histogram-based gradient boosting; it bins the features itself, so it is trained on the raw features.
+CLASSIFIER = "rf"
+# the number of bins for the classifiers that use quantized features (at most 256, to fit in uint8)
+QUANTIZATION_BINS = 256
+
 # since from 0.0 to 1.0
 W_ACCURACY = 500
 RANDOM_ACCURACY = 0.4
 # since from 10 to 1000, and the higher, the worse
 W_ENERGY = -1
 
+# if not None: the energy budget (uC per window). Only the subsets that fit in it are evaluated,
+# and the most accurate one is selected. Can also be passed on the command line as `--budget=<uC>`.
+ENERGY_BUDGET = None
+
+# the (W_ACCURACY, W_ENERGY) pairs to explore in the weight sweep mode
+SWEEP_WEIGHTS = [(125, -1), (250, -1), (500, -1), (1000, -1), (2000, -1)]
+
 USE_N_FOLD_CROSS_VALIDATION = True
 NUM_VALIDATION_ITERATIONS = 3
 
+# if cross-validation is used: leave out each of the subjects in turn, instead of just the first one.
+# The scores are averaged over all subjects. (The progressive sampling is not used in this mode.)
+USE_LEAVE_ONE_SUBJECT_OUT = False
+
+# the number of worker processes for parallel evaluation; None means all CPU cores
+NUM_WORKERS = None
+
 # if cross-validation is not used: the number of trials on which the score is averaged
 NUM_TRIALS = 1
 
+# Progressive sampling: first evaluate a feature subset on a stratified subsample of the training windows,
+# and only move on to the larger samples if the subset still looks competitive
+USE_PROGRESSIVE_SAMPLING = False
+# the fraction of the training windows used at each stage; the last stage should use all of them
+PROGRESSIVE_SAMPLE_SIZES = [0.1, 0.3, 1.0]
+# a subset is competitive if its score at a stage is no more than this below the best score at that stage so far.
+# The subsets that are not competitive get the accuracy REJECTED_ACCURACY (see ml_state.py)
+PROGRESSIVE_MARGIN = 0.05
+
 SUBSETS = ["train", "validation", "test"]
 
 def roundacc(acc):
@@ -171,7 +171,7 @@ def parse_pso(dataset, suffix):
                 continue
             parsing = True
         else:
-            if "Multi objective" in line:
+            if "Multi objective" in line or "Single objective" in line or "Merged Pareto front" in line:
                 multi_result.append(result)
                 multi_feature_names.append(feature_names)
                 result = []
@@ -103,6 +103,45 @@ def select(names, groups, used_indexes, do_subselection = False):
 
 ###########################################
 
+#
+# Feature subsets as integer bitmasks: the bit `i` is set if the group `i` is in the subset
+#
+def subset_to_bitmask(indexes):
+    mask = 0
+    for i in indexes:
+        mask |= 1 << i
+    return mask
+
+def bitmask_to_subset(mask):
+    return tuple(i for i, bit in enumerate(reversed(bin(mask)[2:])) if bit == "1")
+
+###########################################
+
+#
+# This separates the command line arguments in positional ones and options (`--name` or `--name=value`).
+# The options without a value are set to True.
+#
+def parse_args(argv):
+    args = []
+    options = {}
+    for arg in argv:
+        if arg.startswith("--"):
+            name, _, value = arg[2:].partition("=")
+            options[name] = value if value else True
+        else:
+            args.append(arg)
+    return args, options
+
+# the value of the option `name` from `parse_args`, converted with `convert`; `default` if not given
+def option_value(options, name, convert, default=None):
+    if name not in options:
+        return default
+    if options[name] is True:
+        raise ValueError("--{0} needs a value: --{0}=<value>".format(name))
+    return convert(options[name])
+
+###########################################
+
 ALL_DATASETS = ["UCI HAR Dataset", "SPHERE", "PAMAP2"]
 
 ALL_DATASETS_SHORT = ["har", "sphere", "pamap2"]